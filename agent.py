@@ -0,0 +1,197 @@
+import json
+import time
+import base64
+import numpy as np
+from contextlib import contextmanager
+
+from util import image_to_uri
+from prompt import system_prompt_simple
+from tracing import tracer
+from cancellation import Cancelled, sleep
+
+# Stages timed in every step of the agent loop
+STAGES = ("capture", "encode", "llm_ttft", "llm", "parse", "motion", "speech_wait", "settle")
+
+
+class AnthropicLLM:
+    """Vision LLM used by the agent loop"""
+
+    def __init__(self, client, model="claude-3-5-sonnet-20240620", system=system_prompt_simple,
+                 max_tokens=1000, temperature=0.5):
+        #model="claude-3-5-sonnet-20241022"
+        self.client = client
+        self.model = model
+        self.system = system
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+
+    def stream(self, messages, cancel=None):
+        """Yield the text of the model response to the message history as it is generated"""
+        with self.client.messages.stream(
+            model=self.model,
+            system=self.system,
+            messages=messages,
+            max_tokens=self.max_tokens,
+            temperature=self.temperature
+        ) as stream:
+            if cancel is None:
+                yield from stream.text_stream
+                return
+            # Closing the response aborts a read that is waiting for the next token
+            cancel.add_callback(stream.close)
+            try:
+                for text in stream.text_stream:
+                    cancel.raise_if_cancelled()
+                    yield text
+            except Cancelled:
+                raise
+            except Exception:
+                cancel.raise_if_cancelled()
+                raise
+            finally:
+                cancel.remove_callback(stream.close)
+
+    def complete(self, messages, cancel=None):
+        """Get the text of the model response to the message history"""
+        return "".join(self.stream(messages, cancel))
+
+
+def parse_response(text):
+    """Extract the JSON object from a model response"""
+    t = text[text.find("{"):]
+    t = t[:t.rfind("}")+1]
+    return json.loads(t, strict=False)
+
+
+@contextmanager
+def _stage(step_timings, name):
+    """Time a stage of the step, also recorded as an agent.<name> span"""
+    start = time.perf_counter_ns()
+    try:
+        yield
+    finally:
+        end = time.perf_counter_ns()
+        step_timings[name] = (end - start) / 1e9
+        tracer.complete(f"agent.{name}", start, end)
+
+
+def run_episode(instruction, camera, llm, tts_queue, execute_action, recorder=None, max_steps=10,
+                action_delay=0.5, settle_delay=1.5, cancel=None, encode=image_to_uri):
+    """
+    Run the observe-think-act loop for one instruction.
+
+    Args:
+        instruction (str): Task for the robot
+        camera: Object with get_video_frame() returning a PIL image
+        llm: Object with stream(messages, cancel) yielding the response text
+        tts_queue: Object with add_text(), wait_until_done() and clear_queue()
+        execute_action: Function executing one action dict of the model response, takes a cancel keyword
+        recorder (EpisodeRecorder): Optional recorder, the episode must already be started
+        max_steps (int): Maximum number of model calls
+        action_delay (float): Pause after every action in seconds
+        settle_delay (float): Pause before the next frame is captured in seconds
+        cancel (CancellationToken): Stops the episode within one control tick, raises Cancelled
+        encode: Function converting a frame array to base64 PNG, such as EncoderPool.encode shared by several arms
+
+    Returns:
+        list: Stage timings in seconds of every step
+    """
+    if cancel is not None:
+        # Cancelling also cuts off the speech of the episode
+        cancel.add_callback(tts_queue.clear_queue)
+    try:
+        return _run_steps(instruction, camera, llm, tts_queue, execute_action, recorder, max_steps,
+                          action_delay, settle_delay, cancel, encode)
+    finally:
+        if cancel is not None:
+            cancel.remove_callback(tts_queue.clear_queue)
+
+
+def _run_steps(instruction, camera, llm, tts_queue, execute_action, recorder, max_steps,
+               action_delay, settle_delay, cancel, encode):
+    message_history = []
+    timings = []
+    for step in range(max_steps):
+        if cancel is not None:
+            cancel.raise_if_cancelled()
+        step_start = time.perf_counter_ns()
+        step_timings = {}
+
+        with _stage(step_timings, "capture"):
+            image = camera.get_video_frame()
+
+        for old_step in range(0, len(message_history)):
+            if message_history[old_step]['role'] == 'user':
+                message_history[old_step]['content'] = '[IMAGE]'
+
+        with _stage(step_timings, "encode"):
+            image_data = encode(np.array(image))
+        user_message = {
+                              "role": "user",
+                              "content": [
+                                {
+                                  "type": "image",
+                                  "source": {
+                                      "type": "base64",
+                                      "media_type": "image/png",
+                                      "data":  image_data
+                                  },
+                                },
+                              ],
+                            }
+        if step == 0:
+            user_message["content"].insert(0, {"type": "text", "text": f"<instruction>{instruction}</instruction>"})
+        message_history.append(user_message)
+
+        with _stage(step_timings, "llm"):
+            llm_start = time.perf_counter_ns()
+            parts = []
+            for text in llm.stream(message_history, cancel):
+                if not parts:
+                    first_token = time.perf_counter_ns()
+                    step_timings["llm_ttft"] = (first_token - llm_start) / 1e9
+                    tracer.complete("agent.llm_ttft", llm_start, first_token)
+                parts.append(text)
+            t = "".join(parts)
+        print(t)
+        message_history.append({"role": "assistant", "content": t})
+        step_record = {"response": t}
+        done = False
+        try:
+            with _stage(step_timings, "parse"):
+                r = parse_response(t)
+            step_record["parsed"] = r
+            tts_queue.add_text(r["reasoning_ru"], speed=1.1)
+
+            with _stage(step_timings, "motion"):
+                for a in r["actions"]:
+                    execute_action(a, cancel=cancel)
+                    sleep(action_delay, cancel)
+            if len(r["actions"]) == 0:
+                done = True
+            else:
+                with _stage(step_timings, "speech_wait"):
+                    tts_queue.wait_until_done()
+                    if cancel is not None:
+                        cancel.raise_if_cancelled()
+
+                with _stage(step_timings, "settle"):
+                    sleep(settle_delay, cancel)
+        except KeyboardInterrupt:
+            done = True
+        except Cancelled:
+            step_record["error"] = "cancelled"
+            raise
+        except Exception as ex:
+            print(ex)
+            step_record["error"] = str(ex)
+        finally:
+            step_end = time.perf_counter_ns()
+            step_timings["step"] = (step_end - step_start) / 1e9
+            tracer.complete("agent.step", step_start, step_end, step=step)
+            timings.append(step_timings)
+            if recorder is not None:
+                recorder.record_step(step, frame=base64.b64decode(image_data), timings=step_timings, **step_record)
+        if done:
+            break
+    return timings
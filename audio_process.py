@@ -0,0 +1,264 @@
+import threading
+import traceback
+import multiprocessing as mp
+import numpy as np
+from multiprocessing import shared_memory
+from queue import Queue
+
+from events import EventBus, STOPPED
+from stt import WhisperCommandQueue, VoiceActivityDetection, SpeechSegmenter, transcribe_audio
+from tracing import tracer
+
+# Header of the ring buffer: total samples written, closed flag
+_HEADER_ITEMS = 2
+_HEADER_BYTES = _HEADER_ITEMS * np.dtype(np.int64).itemsize
+
+
+class SharedAudioRing:
+    """
+    Single producer ring buffer of float32 samples in shared memory.
+
+    The writer publishes the total number of written samples in the header, every reader keeps
+    its own read position. Readers that fall more than the capacity behind skip the overwritten audio.
+    Samples are written and copied out with the condition held, chunks are small, so a reader never
+    sees a region the writer is overwriting.
+    """
+
+    def __init__(self, capacity, condition, name=None):
+        self.capacity = capacity
+        self.condition = condition
+        self.owner = name is None
+        self._attach(name)
+        if self.owner:
+            self.header[:] = 0
+
+    def _attach(self, name):
+        size = _HEADER_BYTES + self.capacity * np.dtype(np.float32).itemsize
+        self.shm = shared_memory.SharedMemory(name=name, create=name is None, size=size)
+        self.header = np.ndarray((_HEADER_ITEMS,), dtype=np.int64, buffer=self.shm.buf[:_HEADER_BYTES])
+        self.data = np.ndarray((self.capacity,), dtype=np.float32, buffer=self.shm.buf[_HEADER_BYTES:])
+
+    def __getstate__(self):
+        return {"capacity": self.capacity, "condition": self.condition, "name": self.shm.name}
+
+    def __setstate__(self, state):
+        self.capacity = state["capacity"]
+        self.condition = state["condition"]
+        self.owner = False
+        self._attach(state["name"])
+
+    def write_position(self):
+        with self.condition:
+            return int(self.header[0])
+
+    def write(self, samples):
+        """Append samples, overwriting the oldest audio when the buffer is full"""
+        total = len(samples)
+        # Positions count every sample, only the newest capacity samples are kept
+        samples = samples[-self.capacity:]
+        count = len(samples)
+        with self.condition:
+            position = int(self.header[0]) + total - count
+            start = position % self.capacity
+            first = min(count, self.capacity - start)
+            self.data[start:start + first] = samples[:first]
+            self.data[:count - first] = samples[first:]
+            self.header[0] = position + count
+            self.condition.notify_all()
+
+    def read(self, position, count, timeout=None):
+        """
+        Read count samples starting at position, blocks until they were written.
+
+        Returns:
+            (samples, new_position), samples are None on timeout or after close()
+        """
+        with self.condition:
+            self.condition.wait_for(lambda: self.header[0] - position >= count or self.header[1], timeout)
+            written = int(self.header[0])
+            if self.header[1] or written - position < count:
+                return None, position
+            if written - position > self.capacity:
+                # The writer lapped us, skip to the oldest audio still in the buffer
+                position = written - self.capacity
+            start = position % self.capacity
+            first = min(count, self.capacity - start)
+            # concatenate copies, the samples stay valid after the writer moves on
+            samples = np.concatenate((self.data[start:start + first], self.data[:count - first]))
+        return samples, position + count
+
+    def close(self):
+        """Wake up all readers, further reads return None"""
+        with self.condition:
+            self.header[1] = 1
+            self.condition.notify_all()
+
+    def release(self):
+        """Detach from the shared memory, the creating process also frees it"""
+        # Views into the buffer have to be gone before it can be closed
+        del self.header
+        del self.data
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+def _capture_main(ring, running, sample_rate, chunk_size):
+    """Capture process: reads the microphone into the ring buffer and nothing else"""
+    import pyaudio
+
+    p = pyaudio.PyAudio()
+    stream = p.open(
+        format=pyaudio.paFloat32,
+        channels=1,
+        rate=sample_rate,
+        input=True,
+        frames_per_buffer=chunk_size
+    )
+    try:
+        while running.is_set():
+            data = stream.read(chunk_size, exception_on_overflow=False)
+            ring.write(np.frombuffer(data, dtype=np.float32))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stream.stop_stream()
+        stream.close()
+        p.terminate()
+        ring.release()
+
+
+def _pipeline_main(ring, running, listening, ready, commands, client_factory, sample_rate, chunk_size):
+    """Pipeline process: VAD, endpointing and transcription of the captured audio"""
+    try:
+        client = client_factory()
+        segmenter = SpeechSegmenter(VoiceActivityDetection(sampling_rate=sample_rate), chunk_size)
+        ready.set()
+        position = ring.write_position()
+        while running.is_set():
+            if not listening.is_set():
+                listening.wait()
+                # Skip the audio captured while we were not listening
+                position = ring.write_position()
+                segmenter.reset()
+                continue
+
+            samples, position = ring.read(position, chunk_size)
+            if samples is None:
+                break
+
+            try:
+                segment = segmenter.feed(samples.reshape(-1, 1))
+                if not segmenter.recording and segment is None:
+                    # Nothing to attach the spans of idle chunks to
+                    tracer.drain()
+                if segment is not None:
+                    text = transcribe_audio(client, segment, sample_rate)
+                    if text:
+                        # Spans of this process travel with the command, the tracer follows ROBOT_TRACE
+                        commands.put((text, tracer.drain()))
+            except Exception as e:
+                traceback.print_exc()
+                print(f"Error in audio processing: {e}")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        commands.put(None)
+        ring.release()
+
+
+class ProcessWhisperCommandQueue(WhisperCommandQueue):
+    """
+    WhisperCommandQueue with capture and VAD/transcription running in separate processes.
+
+    Keeps torch inference and the audio state machine away from the GIL of the control process.
+    Audio moves between the processes over a SharedAudioRing, commands come back on a queue.
+    """
+
+    def __init__(self, tts_queue, client_factory, event_bus=None, buffer_seconds=10, ready_timeout=120.0):
+        """
+        Args:
+            tts_queue: TTS queue, listening is paused while it speaks
+            client_factory: Picklable function that creates the OpenAI client in the pipeline process
+            event_bus (EventBus): Bus shared with the TTS queue
+            buffer_seconds (int): Size of the shared audio ring buffer
+            ready_timeout (float): Maximum time to wait for the VAD model to load in seconds
+        """
+        self.queue = Queue()
+        self.is_running = True
+        self.tts_queue = tts_queue
+        self.event_bus = event_bus or getattr(tts_queue, 'event_bus', None) or EventBus()
+        self.sample_rate = 16000
+        self.chunk_size = 2048
+        self.is_paused = False
+        self.pause_lock = threading.Lock()
+
+        # Spawn: torch and PortAudio must not be forked from a threaded process
+        ctx = mp.get_context("spawn")
+        self.running = ctx.Event()
+        self.running.set()
+        self.listening = ctx.Event()
+        self.listening.set()
+        self.ready = ctx.Event()
+        self.commands = ctx.Queue()
+        self.ring = SharedAudioRing(self.sample_rate * buffer_seconds, ctx.Condition())
+
+        self.capture_process = ctx.Process(
+            target=_capture_main,
+            args=(self.ring, self.running, self.sample_rate, self.chunk_size),
+            daemon=True
+        )
+        self.pipeline_process = ctx.Process(
+            target=_pipeline_main,
+            args=(self.ring, self.running, self.listening, self.ready, self.commands, client_factory,
+                  self.sample_rate, self.chunk_size),
+            daemon=True
+        )
+        self.capture_process.start()
+        self.pipeline_process.start()
+
+        # Forward the listening state to the pipeline process and commands back to the bus
+        self.listening_thread = threading.Thread(target=self._mirror_listening, daemon=True)
+        self.listening_thread.start()
+        self.worker_thread = threading.Thread(target=self._receive_commands, daemon=True)
+        self.worker_thread.start()
+
+        # Commands can only be detected once the pipeline process has loaded the VAD model
+        if not self.ready.wait(ready_timeout):
+            self.stop()
+            raise RuntimeError("Audio pipeline process failed to start")
+        print("Listening...")
+
+    def _mirror_listening(self):
+        while self.is_running:
+            listen = self.event_bus.wait_for(lambda: self._should_listen(), timeout=0)
+            if listen:
+                self.listening.set()
+            else:
+                self.listening.clear()
+            self.event_bus.wait_for(lambda: self._should_listen() != listen or not self.is_running, timeout=1.0)
+
+    def _receive_commands(self):
+        while self.is_running:
+            item = self.commands.get()
+            if item is None:
+                break
+            text, events = item
+            tracer.extend(events)
+            self._put_command(text)
+
+    def stop(self):
+        """Safely stop both audio processes"""
+        self.is_running = False
+        self.event_bus.publish(STOPPED)
+        self.running.clear()
+        self.listening.set()
+        self.ring.close()
+        for process in (self.pipeline_process, self.capture_process):
+            process.join(timeout=2.0)
+            if process.is_alive():
+                process.terminate()
+        self.commands.put(None)
+        if self.worker_thread.is_alive():
+            self.worker_thread.join(timeout=2.0)
+        self.ring.release()
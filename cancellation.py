@@ -0,0 +1,70 @@
+import time
+import threading
+from typing import Callable, Optional
+
+
+class Cancelled(Exception):
+    """Raised inside work that was cancelled through its CancellationToken"""
+
+
+class CancellationToken:
+    """
+    Cooperative cancellation shared by the LLM call, the servo moves and the TTS queue of an episode.
+
+    Long running code checks the token at every control tick or uses its sleep(), blocking calls that
+    cannot check it (network reads, audio playback) register a callback that aborts them.
+    """
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.lock = threading.Lock()
+        self.callbacks = []
+        self.reason = None
+
+    @property
+    def cancelled(self) -> bool:
+        return self.event.is_set()
+
+    def cancel(self, reason: Optional[str] = None):
+        """Cancel the work, runs every registered callback once"""
+        with self.lock:
+            if self.event.is_set():
+                return
+            self.reason = reason
+            self.event.set()
+            callbacks, self.callbacks = self.callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                print(f"Error in cancellation callback: {e}")
+
+    def raise_if_cancelled(self):
+        if self.event.is_set():
+            raise Cancelled(self.reason)
+
+    def sleep(self, seconds: float):
+        """Sleep that ends with Cancelled as soon as the token is cancelled"""
+        if self.event.wait(seconds):
+            raise Cancelled(self.reason)
+
+    def add_callback(self, callback: Callable[[], None]):
+        """Call callback on cancellation, immediately if the token is already cancelled"""
+        with self.lock:
+            if not self.event.is_set():
+                self.callbacks.append(callback)
+                return
+        callback()
+
+    def remove_callback(self, callback: Callable[[], None]):
+        with self.lock:
+            if callback in self.callbacks:
+                self.callbacks.remove(callback)
+
+
+def sleep(seconds: float, cancel: Optional[CancellationToken] = None):
+    """time.sleep() that honours an optional cancellation token"""
+    if cancel is None:
+        time.sleep(seconds)
+    else:
+        cancel.sleep(seconds)
@@ -0,0 +1,174 @@
+import json
+import heapq
+import itertools
+import threading
+import socketserver
+from typing import Optional
+
+from cancellation import CancellationToken
+from events import EventBus, COMMAND_READY
+from stt import VoiceCommand
+from tracing import tracer
+
+
+class CommandScheduler:
+    """
+    Orders commands from all sources by priority and preempts the running episode.
+
+    A command submitted while an episode runs cancels it if its priority is higher, or the same with
+    VoiceCommand.preempt set (spoken stop commands, commands from the CommandServer). Other commands
+    wait for the episode to end.
+    """
+
+    def __init__(self, event_bus: Optional[EventBus] = None):
+        self.event_bus = event_bus or EventBus()
+        self.lock = threading.Lock()
+        self.heap = []
+        self.sequence = itertools.count()
+        self.current = None
+        self.current_token = None
+        self.is_running = True
+        self.forwarders = []
+
+    def submit(self, command: VoiceCommand):
+        """Add a command, cancels the running episode if the command preempts it"""
+        with self.lock:
+            heapq.heappush(self.heap, (-command.priority, next(self.sequence), command))
+            depth = len(self.heap)
+            current = self.current
+            token = self.current_token
+            preempt = current is not None and (command.priority > current.priority or
+                                               (command.preempt and command.priority == current.priority))
+        tracer.counter("commands.queue_depth", depth)
+        if preempt:
+            print(f"Preempting: {current.text} -> {command.text}")
+            token.cancel(f"preempted by: {command.text}")
+        self.event_bus.publish(COMMAND_READY)
+
+    def next(self, timeout=1.0):
+        """
+        Block until a command is available or the timeout expires, the highest priority one comes first.
+        Returns None on timeout, callers loop while is_running.
+
+        The command is marked as running in the same step, so a command submitted while the caller
+        prepares the episode already preempts it.
+        """
+        self.event_bus.wait_for(lambda: bool(self.heap) or not self.is_running, timeout)
+        with self.lock:
+            if not self.heap:
+                return None
+            _, _, command = heapq.heappop(self.heap)
+            self.current = command
+            self.current_token = CancellationToken()
+            tracer.counter("commands.queue_depth", len(self.heap))
+            return command
+
+    def begin(self, command: VoiceCommand) -> CancellationToken:
+        """Get the token that cancels command, marks it as running if it did not come from next()"""
+        with self.lock:
+            if self.current is not command:
+                self.current = command
+                self.current_token = CancellationToken()
+            return self.current_token
+
+    def finish(self):
+        with self.lock:
+            self.current = None
+            self.current_token = None
+
+    def forward(self, source):
+        """Submit every command of a source with get_command(), such as WhisperCommandQueue"""
+        self.forwarders.append(forward_commands(source, self))
+
+    def stop(self):
+        self.is_running = False
+        with self.lock:
+            token = self.current_token
+        if token is not None:
+            token.cancel("shutdown")
+        self.event_bus.publish(COMMAND_READY)
+
+
+def forward_commands(source, target):
+    """Move commands from source.get_command() to target.submit() in a thread while target.is_running"""
+    def run():
+        while target.is_running:
+            command = source.get_command()
+            if command is not None:
+                target.submit(command)
+            elif not getattr(source, 'is_running', True):
+                break
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread
+
+
+class CommandServer:
+    """
+    Accepts commands on a local TCP socket, one per line.
+
+    A line is either plain text or JSON {"text": ..., "priority": ..., "arm": ..., "preempt": ...}. Example:
+        echo '{"text": "stop", "priority": 5}' | nc 127.0.0.1 8765
+
+    Commands sent here are deliberate, so by default they also replace a running episode of the same
+    priority. Every line is answered with "ok" or "error: <reason>".
+
+    The scheduler is a CommandScheduler or anything else with submit(), such as an Orchestrator.
+    """
+
+    def __init__(self, scheduler: CommandScheduler, host="127.0.0.1", port=8765, default_priority=1):
+        self.scheduler = scheduler
+        self.default_priority = default_priority
+        server = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                for line in self.rfile:
+                    try:
+                        command = server.parse(line.decode("utf-8").strip())
+                    except (ValueError, KeyError, TypeError) as e:
+                        # UnicodeDecodeError and JSONDecodeError are ValueErrors
+                        print(f"Invalid command: {line!r} ({e})")
+                        self.wfile.write(f"error: {e}\n".encode("utf-8"))
+                        continue
+                    if command is None:
+                        continue
+                    server.scheduler.submit(command)
+                    self.wfile.write(b"ok\n")
+
+        self.server = socketserver.ThreadingTCPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def parse(self, line):
+        """Command of a line, None for an empty line. Raises ValueError, KeyError or TypeError for invalid JSON"""
+        if not line:
+            return None
+        if not line.startswith("{"):
+            return VoiceCommand(text=line, priority=self.default_priority, preempt=True)
+        data = json.loads(line)
+        if not isinstance(data, dict):
+            raise TypeError("expected a JSON object")
+        text = data["text"]
+        priority = data.get("priority", self.default_priority)
+        arm = data.get("arm")
+        preempt = data.get("preempt", True)
+        if not isinstance(text, str) or not text.strip():
+            raise TypeError("text must be a non-empty string")
+        if isinstance(priority, bool) or not isinstance(priority, int):
+            raise TypeError("priority must be an integer")
+        if arm is not None and not isinstance(arm, str):
+            raise TypeError("arm must be a string")
+        if not isinstance(preempt, bool):
+            raise TypeError("preempt must be true or false")
+        return VoiceCommand(text=text, priority=priority, arm=arm, preempt=preempt)
+
+    def start(self):
+        self.thread.start()
+        print(f"Accepting commands on {self.server.server_address[0]}:{self.server.server_address[1]}")
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
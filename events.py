@@ -0,0 +1,74 @@
+import threading
+from typing import Callable, Optional
+
+# Events published on the bus
+SPEECH_STARTED = "speech_started"
+SPEECH_FINISHED = "speech_finished"
+TTS_IDLE = "tts_idle"
+SPEECH_DONE = "speech_done"  # A tagged TTS request was played or discarded
+COMMAND_READY = "command_ready"
+PAUSED = "paused"
+RESUMED = "resumed"
+STOPPED = "stopped"
+
+# Level state changed by events: event -> (flag, value)
+_FLAG_UPDATES = {
+    SPEECH_STARTED: ("speaking", True),
+    SPEECH_FINISHED: ("speaking", False),
+    PAUSED: ("paused", True),
+    RESUMED: ("paused", False),
+    STOPPED: ("stopped", True),
+}
+
+
+class EventBus:
+    """
+    Condition based signalling between the TTS queue, the voice command queue and the agent loop.
+
+    Components publish events and block in wait_for() until the state they need is reached,
+    instead of polling with sleeps.
+    """
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.flags = {"speaking": False, "paused": False, "stopped": False}
+        self.counts = {}
+
+    def publish(self, event: str):
+        """Publish an event and wake up every waiting thread"""
+        with self.condition:
+            self.counts[event] = self.counts.get(event, 0) + 1
+            if event in _FLAG_UPDATES:
+                flag, value = _FLAG_UPDATES[event]
+                self.flags[flag] = value
+            self.condition.notify_all()
+
+    def is_set(self, flag: str) -> bool:
+        """Get the current value of a level flag (speaking, paused, stopped)"""
+        with self.condition:
+            return self.flags.get(flag, False)
+
+    def count(self, event: str) -> int:
+        """Get how many times an event was published"""
+        with self.condition:
+            return self.counts.get(event, 0)
+
+    def wait_for(self, predicate: Callable[[], bool], timeout: Optional[float] = None) -> bool:
+        """
+        Block until predicate() is true. The predicate is re-evaluated after every published event.
+
+        Args:
+            predicate: Cheap check without side effects, called with the bus lock held
+            timeout (float): Maximum time to wait in seconds, None waits forever
+
+        Returns:
+            bool: The last result of the predicate
+        """
+        with self.condition:
+            return self.condition.wait_for(predicate, timeout)
+
+    def wait_for_event(self, event: str, timeout: Optional[float] = None) -> bool:
+        """Block until the next time an event is published"""
+        with self.condition:
+            seen = self.counts.get(event, 0)
+            return self.condition.wait_for(lambda: self.counts.get(event, 0) > seen, timeout)
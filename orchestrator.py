@@ -0,0 +1,274 @@
+import time
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from agent import run_episode
+from cancellation import Cancelled
+from commands import CommandScheduler, forward_commands
+from events import EventBus
+from tracing import tracer
+from util import image_to_uri
+
+
+class FairRateLimiter:
+    """
+    LLM request budget shared by all arms.
+
+    A token bucket refilled at requests_per_minute. Requests are granted in the order the arms started
+    waiting; an arm has at most one request in flight, so this is round robin across arms: an arm whose
+    request just went through queues behind every arm that is already waiting.
+    """
+
+    def __init__(self, requests_per_minute=None, burst=1):
+        self.rate = requests_per_minute / 60.0 if requests_per_minute else None
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.perf_counter()
+        self.condition = threading.Condition()
+        self.waiting = deque()
+        self.stats = {}  # arm -> {"requests", "wait", "max_wait"}
+
+    def _refill(self):
+        now = time.perf_counter()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def _wake(self):
+        with self.condition:
+            self.condition.notify_all()
+
+    def acquire(self, name, cancel=None):
+        """Block until the arm may send a request, raises Cancelled if cancel is cancelled while waiting"""
+        ticket = object()
+        start = time.perf_counter_ns()
+        with self.condition:
+            self.waiting.append(ticket)
+            if cancel is not None:
+                cancel.add_callback(self._wake)
+            try:
+                while True:
+                    if cancel is not None:
+                        cancel.raise_if_cancelled()
+                    if self.waiting[0] is ticket:
+                        if self.rate is None:
+                            break
+                        self._refill()
+                        if self.tokens >= 1:
+                            self.tokens -= 1
+                            break
+                        self.condition.wait((1 - self.tokens) / self.rate)
+                    else:
+                        self.condition.wait()
+            finally:
+                self.waiting.remove(ticket)
+                self.condition.notify_all()
+                if cancel is not None:
+                    cancel.remove_callback(self._wake)
+
+            end = time.perf_counter_ns()
+            wait = (end - start) / 1e9
+            stats = self.stats.setdefault(name, {"requests": 0, "wait": 0.0, "max_wait": 0.0})
+            stats["requests"] += 1
+            stats["wait"] += wait
+            stats["max_wait"] = max(stats["max_wait"], wait)
+        tracer.complete("llm.rate_limit", start, end, arm=name)
+
+    def get_stats(self):
+        with self.condition:
+            return {name: {**stats, "mean_wait": stats["wait"] / stats["requests"]}
+                    for name, stats in self.stats.items()}
+
+    def print_stats(self):
+        for name, stats in self.get_stats().items():
+            print(f"LLM budget {name}: {stats['requests']} requests, "
+                  f"wait mean {stats['mean_wait']:.3f}s max {stats['max_wait']:.3f}s")
+
+
+class RateLimitedLLM:
+    """LLM of one arm that takes a request from the shared FairRateLimiter before every call"""
+
+    def __init__(self, llm, limiter, name):
+        self.llm = llm
+        self.limiter = limiter
+        self.name = name
+
+    def stream(self, messages, cancel=None):
+        self.limiter.acquire(self.name, cancel)
+        yield from self.llm.stream(messages, cancel)
+
+    def complete(self, messages, cancel=None):
+        return "".join(self.stream(messages, cancel))
+
+
+class EncoderPool:
+    """
+    Frame encoder threads shared by all arms.
+
+    Bounds the CPU spent on PNG encoding, so frames of many arms arriving at once do not starve
+    the servo control threads.
+    """
+
+    def __init__(self, max_workers=2):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="encoder")
+
+    def encode(self, image):
+        return self.executor.submit(self._encode, image, tracer.get_context()).result()
+
+    @staticmethod
+    def _encode(image, context):
+        # Spans of the encoder thread belong to the arm that asked for the frame
+        with tracer.context(**context):
+            return image_to_uri(image)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
+
+
+class Cell:
+    """
+    One arm with its camera, TTS queue, command scheduler and episode loop, run in its own thread.
+
+    Args:
+        name (str): Name of the arm, commands are routed by it
+        arm (Arm): Arm executing the actions
+        camera: Object with get_video_frame() returning a PIL image
+        llm: Object with stream(messages, cancel), usually a RateLimitedLLM around the shared client
+        tts_queue: TTS queue of this cell only, such as an OpenAITTSQueue.channel() of the shared speaker
+        recorder (EpisodeRecorder): Optional recorder of this cell only
+        event_bus (EventBus): Bus the command scheduler waits on
+        encode: Frame encoder, such as EncoderPool.encode
+        episode_options: max_steps, action_delay and settle_delay of run_episode
+    """
+
+    def __init__(self, name, arm, camera, llm, tts_queue, recorder=None, event_bus=None, encode=image_to_uri,
+                 **episode_options):
+        self.name = name
+        self.arm = arm
+        self.camera = camera
+        self.llm = llm
+        self.tts_queue = tts_queue
+        self.recorder = recorder
+        self.scheduler = CommandScheduler(event_bus or EventBus())
+        self.encode = encode
+        self.episode_options = episode_options
+        self.thread = None
+        # Start of the timeline of the next episode trace, cells sharing the tracer are set by Orchestrator
+        self.trace_start_ns = time.perf_counter_ns()
+        self.peers = [self]
+
+    def execute_action(self, action, cancel=None):
+        self.arm.execute_string_command(action["target_square"], action["target_arm_height"], action["gripper"], cancel)
+
+    def run_command(self, command):
+        """Run the episode of one command on this arm, returns the stage timings of its steps"""
+        with tracer.context(arm=self.name):
+            return self._run_command(command)
+
+    def _run_command(self, command):
+        print(f"[{self.name}] Processing command: {command.text}")
+        cancel = self.scheduler.begin(command)
+        episode_dir = None
+        if self.recorder is not None:
+            episode_dir = self.recorder.start_episode(command.text, priority=command.priority, arm=self.name)
+        status = "completed"
+        timings = []
+        try:
+            timings = run_episode(command.text, self.camera, self.llm, self.tts_queue, self.execute_action,
+                                  recorder=self.recorder, cancel=cancel, encode=self.encode, **self.episode_options)
+        except Cancelled as ex:
+            print(f"[{self.name}] Episode cancelled: {ex}")
+            if self.scheduler.is_running:
+                status = "preempted"
+                self.arm.move_to_safe_pose()
+            else:
+                # Shutdown, the arm is parked when the cell thread exits
+                status = "interrupted"
+        except Exception as ex:
+            # A failing arm must not take the other arms down
+            print(f"[{self.name}] Episode failed: {ex}")
+            status = "failed"
+        finally:
+            self.scheduler.finish()
+            if self.recorder is not None:
+                self.recorder.end_episode(status=status)
+        if tracer.enabled and episode_dir is not None:
+            # Everything of this arm since the end of its previous episode, including the utterance of the command
+            tracer.write_chrome_trace(episode_dir / "trace.json", since_ns=self.trace_start_ns, arm=self.name)
+            self.trace_start_ns = time.perf_counter_ns()
+            tracer.discard_before(min(peer.trace_start_ns for peer in self.peers))
+        return timings
+
+    def _run(self):
+        try:
+            while self.scheduler.is_running:
+                command = self.scheduler.next()
+                if command is not None:
+                    self.run_command(command)
+        finally:
+            # Only the cell thread moves the arm, so it also parks it
+            try:
+                self.arm.shutdown()
+            except Exception as ex:
+                print(f"[{self.name}] Failed to park the arm: {ex}")
+
+    def start(self):
+        self.trace_start_ns = time.perf_counter_ns()
+        self.thread = threading.Thread(target=self._run, name=f"cell-{self.name}", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """Cancel the running episode and wait until the cell thread has recorded its end and parked the arm"""
+        self.scheduler.stop()
+        if self.thread is not None:
+            # No timeout, the arm moves until the thread exits and the process must not end before that
+            while self.thread.is_alive():
+                self.thread.join(1.0)
+
+
+class Orchestrator:
+    """
+    Runs several cells concurrently and routes commands to them by VoiceCommand.arm.
+
+    Commands without an arm go to the first cell. Preemption is per cell: a command only cancels
+    the running episode of the arm it is addressed to.
+    """
+
+    def __init__(self, cells):
+        self.cells = {cell.name: cell for cell in cells}
+        for cell in cells:
+            cell.peers = cells
+        self.default = cells[0].name
+        self.is_running = True
+        self.forwarders = []
+
+    def submit(self, command):
+        cell = self.cells.get(command.arm or self.default)
+        if cell is None:
+            print(f"Unknown arm: {command.arm}")
+            return
+        cell.scheduler.submit(command)
+
+    def forward(self, source):
+        """Submit every command of a source with get_command(), such as WhisperCommandQueue"""
+        self.forwarders.append(forward_commands(source, self))
+
+    def start(self):
+        for cell in self.cells.values():
+            cell.start()
+        print(f"Running arms: {', '.join(self.cells)}")
+        return self
+
+    def wait(self):
+        """Block until every cell has stopped"""
+        for cell in self.cells.values():
+            while cell.thread is not None and cell.thread.is_alive():
+                cell.thread.join(1.0)
+
+    def stop(self):
+        self.is_running = False
+        for cell in self.cells.values():
+            cell.scheduler.stop()
+        for cell in self.cells.values():
+            cell.stop()
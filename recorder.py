@@ -0,0 +1,158 @@
+import io
+import os
+import json
+import time
+import uuid
+import numpy as np
+from pathlib import Path
+from PIL import Image
+
+
+class EpisodeRecorder:
+    """
+    Crash-safe recorder of agent episodes.
+
+    Every episode gets its own directory with episode.json, an append-only steps.jsonl and one PNG
+    per frame in frames/. Each step is flushed to disk as soon as it is recorded, so a crash only
+    loses the step that was in progress.
+    """
+
+    def __init__(self, root="episodes"):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.episode_dir = None
+        self.steps_file = None
+
+    def start_episode(self, instruction, **metadata):
+        """Start a new episode, ends the previous one if it is still open. Returns the episode directory."""
+        if self.steps_file is not None:
+            self.end_episode(status="interrupted")
+
+        episode_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+        self.episode_dir = self.root / episode_id
+        (self.episode_dir / "frames").mkdir(parents=True)
+
+        info = {"id": episode_id, "instruction": instruction, "start_time": time.time(), **metadata}
+        self._write_atomic(self.episode_dir / "episode.json", json.dumps(info, ensure_ascii=False, indent=2).encode("utf-8"))
+        self.steps_file = open(self.episode_dir / "steps.jsonl", "a", encoding="utf-8")
+        return self.episode_dir
+
+    def record_step(self, step, frame=None, **data):
+        """
+        Append a step to the current episode.
+
+        Args:
+            step (int): Step number within the episode
+            frame: PNG encoded bytes, a PIL image or an RGB numpy array
+            data: JSON serializable step metadata (model response, parsed actions, timings, errors)
+        """
+        if self.steps_file is None:
+            raise RuntimeError("No episode started")
+
+        record = {"type": "step", "step": step, "time": time.time()}
+        if frame is not None:
+            frame_path = Path("frames") / f"{step:04d}.png"
+            self._write_atomic(self.episode_dir / frame_path, self._encode_frame(frame))
+            record["frame"] = frame_path.as_posix()
+        record.update(data)
+        self._append(record)
+
+    def end_episode(self, status="completed", **data):
+        """Mark the current episode as finished and close its files"""
+        if self.steps_file is None:
+            return
+        self._append({"type": "end", "time": time.time(), "status": status, **data})
+        self.steps_file.close()
+        self.steps_file = None
+
+    def _append(self, record):
+        self.steps_file.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+        self.steps_file.flush()
+        os.fsync(self.steps_file.fileno())
+
+    @staticmethod
+    def _encode_frame(frame):
+        if isinstance(frame, (bytes, bytearray)):
+            return bytes(frame)
+        if isinstance(frame, np.ndarray):
+            frame = Image.fromarray(frame)
+        buffered = io.BytesIO()
+        frame.save(buffered, format="PNG")
+        return buffered.getvalue()
+
+    @staticmethod
+    def _write_atomic(path, content):
+        temp_path = path.with_suffix(path.suffix + ".tmp")
+        with open(temp_path, "wb") as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+
+
+class EpisodeReader:
+    """Random access to the steps and frames of a recorded episode"""
+
+    def __init__(self, episode_dir):
+        self.episode_dir = Path(episode_dir)
+        with open(self.episode_dir / "episode.json", encoding="utf-8") as f:
+            self.info = json.load(f)
+        self.end = None
+        self._offsets = []
+        self._index()
+
+    def _index(self):
+        """Find the byte offset of every complete step record"""
+        offset = 0
+        with open(self.episode_dir / "steps.jsonl", "rb") as f:
+            for line in f:
+                # A crash can leave a partially written last line
+                if line.endswith(b"\n"):
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        record = None
+                    if record is not None:
+                        if record.get("type") == "step":
+                            self._offsets.append(offset)
+                        elif record.get("type") == "end":
+                            self.end = record
+                offset += len(line)
+
+    @property
+    def instruction(self):
+        return self.info["instruction"]
+
+    @property
+    def completed(self):
+        """False if the recording was cut off by a crash"""
+        return self.end is not None
+
+    def __len__(self):
+        return len(self._offsets)
+
+    def __getitem__(self, index):
+        with open(self.episode_dir / "steps.jsonl", "rb") as f:
+            f.seek(self._offsets[index])
+            return json.loads(f.readline())
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def load_frame(self, index):
+        """Load the frame of a step as a PIL image, None if the step has no frame"""
+        record = self[index]
+        if "frame" not in record:
+            return None
+        with Image.open(self.episode_dir / record["frame"]) as image:
+            image.load()
+            return image
+
+
+def list_episodes(root="episodes"):
+    """Get the recorded episode directories, oldest first"""
+    root = Path(root)
+    if not root.exists():
+        return []
+    return sorted(p for p in root.iterdir() if (p / "episode.json").exists())
@@ -0,0 +1,507 @@
+"""
+Replay recorded episodes through the agent loop without the arm, camera, microphone or live APIs.
+
+Frames come from the episode recordings, LLM responses are the recorded ones served either in-process
+or by a local stand-in for the Anthropic Messages API, motion goes to the simulated servo SDK and speech
+to a simulated TTS queue. Reports per-stage and end-to-end latency distributions.
+
+With --arms N every episode is replayed on N simulated arms at once, sharing the LLM client, its request
+budget (--rpm) and the frame encoders, to measure how many arms one host can drive.
+
+Usage:
+    python replay.py episodes/ --runs 3 --output after.json --compare before.json
+    python replay.py episodes/ --arms 4 --rpm 50 --llm server
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+from functools import partial
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+# Motion goes to the simulated SDK, must be set before the first arm starts
+os.environ.setdefault("RISDK_BACKEND", "sim")
+
+from agent import AnthropicLLM, STAGES, run_episode
+from recorder import EpisodeReader, list_episodes
+from tracing import tracer
+from cancellation import sleep
+from orchestrator import Cell, FairRateLimiter, RateLimitedLLM, EncoderPool
+from stt import VoiceCommand
+from robot import Arm, SimulatedSDK, init_sdk, init_components, move_servo, move_two_servos_sync, move_servo_slow, execute_string_command
+
+
+class LatencyModel:
+    """Seeded model of LLM latency: time to first token, then a constant output rate"""
+
+    def __init__(self, ttft=1.0, chars_per_second=400.0, jitter=0.0, seed=0):
+        self.ttft = ttft
+        self.chars_per_second = chars_per_second
+        self.jitter = jitter
+        self.random = random.Random(seed)
+
+    def first_token_delay(self):
+        return max(0.0, self.ttft + self.random.uniform(-self.jitter, self.jitter))
+
+    def generation_delay(self, text):
+        return len(text) / self.chars_per_second if self.chars_per_second else 0.0
+
+
+class RecordedLLM:
+    """Returns recorded responses in order with simulated latency"""
+
+    def __init__(self, latency=None):
+        self.latency = latency or LatencyModel()
+        self.responses = []
+
+    def set_responses(self, responses):
+        self.responses = list(responses)
+
+    def stream(self, messages, cancel=None, chunk_chars=16):
+        text = self.responses.pop(0) if self.responses else '{"actions": [], "reasoning_ru": ""}'
+        sleep(self.latency.first_token_delay(), cancel)
+        for i in range(0, len(text), chunk_chars):
+            chunk = text[i:i + chunk_chars]
+            yield chunk
+            sleep(self.latency.generation_delay(chunk), cancel)
+
+
+# Header selecting the response channel of StandInServer
+CHANNEL_HEADER = "X-Replay-Channel"
+
+
+def channel_client(client, channel):
+    """Copy of an Anthropic client that reads the responses of a channel, shares the connection pool of client"""
+    return client.with_options(default_headers={CHANNEL_HEADER: channel})
+
+
+class StandInServer:
+    """
+    Local HTTP stand-in for the Anthropic Messages API serving recorded responses.
+
+    Point a real client at it with anthropic.Anthropic(base_url=server.url, api_key="replay"),
+    so the HTTP client and SDK overhead are part of the measurement. Supports streaming responses.
+
+    Several arms replaying at once share one client and are told apart by the CHANNEL_HEADER header,
+    see channel_client().
+    """
+
+    def __init__(self, latency=None, chunk_chars=16, host="127.0.0.1", port=0):
+        self.latency = latency or LatencyModel()
+        self.chunk_chars = chunk_chars
+        self.responses = {}  # channel -> remaining responses
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), self._make_handler())
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def set_responses(self, responses, channel=None):
+        with self.lock:
+            self.responses[channel] = list(responses)
+
+    def next_response(self, channel=None):
+        with self.lock:
+            responses = self.responses.get(channel)
+            return responses.pop(0) if responses else '{"actions": [], "reasoning_ru": ""}'
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _make_handler(self):
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                request = json.loads(self.rfile.read(length) or b"{}")
+                text = stand_in.next_response(self.headers.get(CHANNEL_HEADER))
+                model = request.get("model", "replay")
+                if request.get("stream"):
+                    self._stream(text, model)
+                else:
+                    time.sleep(stand_in.latency.first_token_delay() + stand_in.latency.generation_delay(text))
+                    self._send_json(_message(text, model))
+
+            def _send_json(self, body):
+                data = json.dumps(body).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _event(self, name, body):
+                self.wfile.write(f"event: {name}\ndata: {json.dumps(body)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+
+            def _stream(self, text, model):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Cache-Control", "no-cache")
+                self.end_headers()
+                time.sleep(stand_in.latency.first_token_delay())
+                start = _message("", model)
+                start["content"] = []
+                self._event("message_start", {"type": "message_start", "message": start})
+                self._event("content_block_start", {"type": "content_block_start", "index": 0,
+                                                    "content_block": {"type": "text", "text": ""}})
+                for i in range(0, len(text), stand_in.chunk_chars):
+                    chunk = text[i:i + stand_in.chunk_chars]
+                    self._event("content_block_delta", {"type": "content_block_delta", "index": 0,
+                                                        "delta": {"type": "text_delta", "text": chunk}})
+                    time.sleep(stand_in.latency.generation_delay(chunk))
+                self._event("content_block_stop", {"type": "content_block_stop", "index": 0})
+                self._event("message_delta", {"type": "message_delta",
+                                              "delta": {"stop_reason": "end_turn", "stop_sequence": None},
+                                              "usage": {"output_tokens": len(text) // 4}})
+                self._event("message_stop", {"type": "message_stop"})
+
+        return Handler
+
+
+def _message(text, model):
+    return {
+        "id": "msg_replay",
+        "type": "message",
+        "role": "assistant",
+        "model": model,
+        "content": [{"type": "text", "text": text}],
+        "stop_reason": "end_turn",
+        "stop_sequence": None,
+        "usage": {"input_tokens": 0, "output_tokens": len(text) // 4}
+    }
+
+
+class ReplayCamera:
+    """Serves the recorded frames of an episode in step order"""
+
+    def __init__(self, reader):
+        self.reader = reader
+        self.step = 0
+        self.last_frame = None
+
+    def get_video_frame(self):
+        if self.step < len(self.reader):
+            frame = self.reader.load_frame(self.step)
+            if frame is not None:
+                self.last_frame = frame
+        self.step += 1
+        if self.last_frame is None:
+            raise IOError("Failed to capture frame")
+        return self.last_frame
+
+
+class SimulatedTTSQueue:
+    """TTS queue that is busy for a time proportional to the text length instead of playing audio"""
+
+    def __init__(self, seconds_per_char=0.06):
+        self.seconds_per_char = seconds_per_char
+        self.condition = threading.Condition()
+        self.busy_until = 0.0
+
+    def add_text(self, text, speed=1.0, voice='alloy'):
+        with self.condition:
+            now = time.perf_counter()
+            self.busy_until = max(now, self.busy_until) + len(text) * self.seconds_per_char / speed
+
+    def wait_until_done(self, timeout=None):
+        deadline = None if timeout is None else time.perf_counter() + timeout
+        with self.condition:
+            while True:
+                now = time.perf_counter()
+                if now >= self.busy_until:
+                    return True
+                end = self.busy_until if deadline is None else min(self.busy_until, deadline)
+                if deadline is not None and now >= deadline:
+                    return False
+                # clear_queue() wakes the waiter, like cutting off real playback
+                self.condition.wait(end - now)
+
+    def clear_queue(self):
+        with self.condition:
+            self.busy_until = 0.0
+            self.condition.notify_all()
+
+
+def summarize(values):
+    """Distribution summary with nearest-rank percentiles"""
+    if not values:
+        return {"count": 0}
+    ordered = sorted(values)
+
+    def percentile(p):
+        return ordered[min(len(ordered) - 1, max(0, int(round(p / 100 * len(ordered))) - 1))]
+
+    return {
+        "count": len(ordered),
+        "mean": sum(ordered) / len(ordered),
+        "p50": percentile(50),
+        "p90": percentile(90),
+        "p99": percentile(99),
+        "max": ordered[-1]
+    }
+
+
+def execute_action(action, cancel=None):
+    execute_string_command(action["target_square"], action["target_arm_height"], action["gripper"], cancel)
+
+
+def home_arm():
+    init_sdk()
+    servos = init_components()
+    move_servo(servos[0], 1450)
+    move_servo(servos[1], 1825)
+    move_servo(servos[2], 1450)
+    move_servo(servos[6], 1950)
+    move_two_servos_sync(servos, 1450, 1825, 1450)
+    move_servo_slow(servos[6], 1950)
+
+
+def replay(episode_dirs, llm, responses_target, tts_queue, runs=1, action_delay=0.5, settle_delay=1.5, trace_dir=None):
+    """
+    Replay episodes and collect latencies.
+
+    Args:
+        episode_dirs: Recorded episode directories
+        llm: LLM used by the agent loop
+        responses_target: Object with set_responses() that serves the recorded responses to llm
+        tts_queue: TTS queue used by the agent loop
+        trace_dir: Write a Chrome trace of every replayed episode to this directory
+
+    Returns:
+        dict: Latency report
+    """
+    samples = {stage: [] for stage in STAGES + ("step",)}
+    episode_totals = []
+    for run in range(runs):
+        for episode_dir in episode_dirs:
+            reader = EpisodeReader(episode_dir)
+            if len(reader) == 0:
+                continue
+            print(f"Run {run + 1}/{runs}: {reader.info['id']} ({len(reader)} steps)")
+            responses_target.set_responses(step.get("response", "") for step in reader)
+            home_arm()
+            tracer.reset()
+            start = time.perf_counter()
+            timings = run_episode(reader.instruction, ReplayCamera(reader), llm, tts_queue, execute_action,
+                                  max_steps=len(reader), action_delay=action_delay, settle_delay=settle_delay)
+            episode_totals.append(time.perf_counter() - start)
+            tts_queue.clear_queue()
+            if trace_dir is not None:
+                tracer.write_chrome_trace(Path(trace_dir) / f"{reader.info['id']}-run{run + 1}.json")
+            for step_timings in timings:
+                for stage, value in step_timings.items():
+                    samples.setdefault(stage, []).append(value)
+
+    report = {
+        "episodes": len(episode_totals),
+        "stages": {stage: summarize(values) for stage, values in samples.items()},
+        "episode": summarize(episode_totals)
+    }
+    if tracer.enabled:
+        report["spans"] = tracer.get_histograms()
+    return report
+
+
+def replay_arms(episode_dirs, cells, load_responses, runs=1, trace_dir=None):
+    """
+    Replay episodes on several arms at once, every arm replays every episode.
+
+    Args:
+        episode_dirs: Recorded episode directories
+        cells: Cells with simulated arms, their camera is replaced by the recorded frames of each episode
+        load_responses: Dict of cell name -> function(responses) serving recorded responses to the LLM of the cell
+        trace_dir: Write one Chrome trace of all arms to this directory
+
+    Returns:
+        dict: Latency report over all arms with a breakdown per arm
+    """
+    readers = [reader for reader in map(EpisodeReader, episode_dirs) if len(reader) > 0]
+    samples = {cell.name: {stage: [] for stage in STAGES + ("step",)} for cell in cells}
+    episode_totals = {cell.name: [] for cell in cells}
+
+    def run_cell(cell):
+        for run in range(runs):
+            for reader in readers:
+                load_responses[cell.name](step.get("response", "") for step in reader)
+                cell.arm.start()
+                cell.camera = ReplayCamera(reader)
+                cell.episode_options["max_steps"] = len(reader)
+                start = time.perf_counter()
+                timings = cell.run_command(VoiceCommand(reader.instruction, arm=cell.name))
+                episode_totals[cell.name].append(time.perf_counter() - start)
+                cell.tts_queue.clear_queue()
+                for step_timings in timings:
+                    for stage, value in step_timings.items():
+                        samples[cell.name].setdefault(stage, []).append(value)
+
+    tracer.reset()
+    start = time.perf_counter()
+    threads = [threading.Thread(target=run_cell, args=(cell,), name=f"cell-{cell.name}") for cell in cells]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall_time = time.perf_counter() - start
+    if trace_dir is not None:
+        tracer.write_chrome_trace(Path(trace_dir) / f"arms{len(cells)}.json")
+
+    merged = {}
+    for cell_samples in samples.values():
+        for stage, values in cell_samples.items():
+            merged.setdefault(stage, []).extend(values)
+    all_totals = [total for totals in episode_totals.values() for total in totals]
+    report = {
+        "episodes": len(all_totals),
+        "stages": {stage: summarize(values) for stage, values in merged.items()},
+        "episode": summarize(all_totals),
+        "wall_time": wall_time,
+        "episodes_per_minute": len(all_totals) / wall_time * 60 if wall_time else 0.0,
+        "arms": {name: {"episode": summarize(totals), "llm": summarize(samples[name]["llm"])}
+                 for name, totals in episode_totals.items()}
+    }
+    if tracer.enabled:
+        report["spans"] = tracer.get_histograms()
+    return report
+
+
+def print_report(report, baseline=None):
+    rows = list(report["stages"].items()) + [("episode", report["episode"])]
+    print(f"{'stage':<12} {'count':>6} {'mean':>9} {'p50':>9} {'p90':>9} {'p99':>9} {'max':>9}")
+    for stage, summary in rows:
+        if not summary.get("count"):
+            continue
+        line = f"{stage:<12} {summary['count']:>6}"
+        for key in ("mean", "p50", "p90", "p99", "max"):
+            line += f" {summary[key]:>9.4f}"
+        if baseline is not None:
+            base = baseline["stages"].get(stage) if stage != "episode" else baseline.get("episode")
+            if base and base.get("count"):
+                line += f"  p50 {summary['p50'] - base['p50']:+.4f}  p90 {summary['p90'] - base['p90']:+.4f}"
+        print(line)
+
+    if "arms" in report:
+        print(f"\n{len(report['arms'])} arms: {report['episodes']} episodes in {report['wall_time']:.2f}s, "
+              f"{report['episodes_per_minute']:.1f} episodes/min")
+        print(f"{'arm':<12} {'episodes':>8} {'episode p50':>12} {'llm p50':>9} {'requests':>9} {'wait mean':>10} {'wait max':>9}")
+        for name, arm in report["arms"].items():
+            budget = report.get("rate_limit", {}).get(name, {})
+            print(f"{name:<12} {arm['episode'].get('count', 0):>8} {arm['episode'].get('p50', 0):>12.4f} "
+                  f"{arm['llm'].get('p50', 0):>9.4f} {budget.get('requests', 0):>9} "
+                  f"{budget.get('mean_wait', 0):>10.4f} {budget.get('max_wait', 0):>9.4f}")
+
+
+def replay_multiple_arms(args, episode_dirs, server=None, client=None):
+    """Set up simulated arms sharing the LLM client, request budget and encoders, then replay on all of them"""
+    limiter = FairRateLimiter(args.rpm)
+    encoder_pool = EncoderPool(args.encoder_workers)
+    cells = []
+    load_responses = {}
+    for i in range(args.arms):
+        name = f"arm{i + 1}"
+        if server is not None:
+            llm = AnthropicLLM(channel_client(client, name))
+            load_responses[name] = partial(server.set_responses, channel=name)
+        else:
+            llm = RecordedLLM(LatencyModel(args.ttft, args.chars_per_second, args.jitter, args.seed + i))
+            load_responses[name] = llm.set_responses
+        cells.append(Cell(name, Arm(name, backend=SimulatedSDK()), None, RateLimitedLLM(llm, limiter, name),
+                          SimulatedTTSQueue(args.tts_seconds_per_char), encode=encoder_pool.encode,
+                          action_delay=args.action_delay, settle_delay=args.settle_delay))
+    try:
+        report = replay_arms(episode_dirs, cells, load_responses, runs=args.runs, trace_dir=args.trace)
+    finally:
+        encoder_pool.shutdown()
+    report["rate_limit"] = limiter.get_stats()
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay recorded episodes and report latencies")
+    parser.add_argument("episodes", nargs="*", default=["episodes"],
+                        help="Episode directories or directories containing episodes")
+    parser.add_argument("--llm", choices=["recorded", "server"], default="recorded",
+                        help="Serve responses in-process or through a local stand-in HTTP server")
+    parser.add_argument("--ttft", type=float, default=1.0, help="Simulated LLM time to first token (s)")
+    parser.add_argument("--chars-per-second", type=float, default=400.0, help="Simulated LLM output rate")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Uniform jitter of the time to first token (s)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--runs", type=int, default=1)
+    parser.add_argument("--tts-seconds-per-char", type=float, default=0.06)
+    parser.add_argument("--action-delay", type=float, default=0.5)
+    parser.add_argument("--settle-delay", type=float, default=1.5)
+    parser.add_argument("--arms", type=int, default=1, help="Replay on this many simulated arms at once")
+    parser.add_argument("--rpm", type=float, help="LLM requests per minute shared by all arms")
+    parser.add_argument("--encoder-workers", type=int, default=2, help="Frame encoder threads shared by all arms")
+    parser.add_argument("--trace", help="Enable tracing and write a Chrome trace per replayed episode to this directory")
+    parser.add_argument("--output", help="Write the report as JSON")
+    parser.add_argument("--compare", help="Report JSON of a previous run to compare against")
+    args = parser.parse_args(argv)
+
+    episode_dirs = []
+    for path in map(Path, args.episodes):
+        episode_dirs.extend([path] if (path / "episode.json").exists() else list_episodes(path))
+    if not episode_dirs:
+        print("No recorded episodes found")
+        return 1
+
+    if args.trace:
+        Path(args.trace).mkdir(parents=True, exist_ok=True)
+        tracer.enable()
+
+    latency = LatencyModel(args.ttft, args.chars_per_second, args.jitter, args.seed)
+    server = None
+    client = None
+    if args.llm == "server":
+        import anthropic
+        server = StandInServer(latency).start()
+        client = anthropic.Anthropic(base_url=server.url, api_key="replay", max_retries=0)
+
+    try:
+        if args.arms > 1 or args.rpm:
+            report = replay_multiple_arms(args, episode_dirs, server, client)
+        else:
+            if server is not None:
+                llm = AnthropicLLM(client)
+                responses_target = server
+            else:
+                llm = RecordedLLM(latency)
+                responses_target = llm
+            report = replay(episode_dirs, llm, responses_target, SimulatedTTSQueue(args.tts_seconds_per_char),
+                            runs=args.runs, action_delay=args.action_delay, settle_delay=args.settle_delay,
+                            trace_dir=args.trace)
+    finally:
+        if server is not None:
+            server.stop()
+
+    report["config"] = vars(args)
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
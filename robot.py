@@ -1,32 +1,102 @@
 import os
+import json
 import time
+import threading
 import platform
 import ctypes
+import weakref
 from ctypes import *
+from tracing import span
+from cancellation import sleep
 
-# Determine the current working directory
-current_dir = os.getcwd()
+class SimulatedSDK:
+    """
+    Stand-in for librisdk without hardware. Accepts every call and remembers the last pulse of each servo.
+
+    Select it with RISDK_BACKEND=sim before the first arm starts, or with set_backend(SimulatedSDK()).
+    """
+
+    def __init__(self, command_latency=0.0):
+        self.command_latency = command_latency
+        self.next_handle = 1
+        self.pulses = {}
+        self.lock = threading.Lock()
+
+    def _create(self, handle):
+        with self.lock:
+            handle._obj.value = self.next_handle
+            self.next_handle += 1
+        return 0
+
+    def RI_SDK_InitSDK(self, log_level, errTextC):
+        return 0
+
+    def RI_SDK_CreateModelComponent(self, group, device, model, handle, errTextC):
+        return self._create(handle)
+
+    def RI_SDK_LinkPWMToController(self, pwm, i2c, address, errTextC):
+        return 0
+
+    def RI_SDK_LinkServodriveToController(self, servo, pwm, channel, errTextC):
+        return 0
+
+    def RI_SDK_exec_ServoDrive_TurnByPulse(self, servo, pulse, errTextC):
+        if self.command_latency:
+            time.sleep(self.command_latency)
+        self.pulses[servo.value] = pulse
+        return 0
+
+    def RI_SDK_exec_ServoDrive_Turn(self, servo, angle, speed, is_async, errTextC):
+        if self.command_latency:
+            time.sleep(self.command_latency)
+        self.pulses[servo.value] = int(angle_to_pulse(angle))
+        return 0
 
-# Determine the platform and set the appropriate library name
-platform_system = platform.system()
-if platform_system == "Windows":
-    lib_name = "librisdk.dll"
-elif platform_system == "Linux":
-    lib_name = "librisdk.so"
-else:
-    raise OSError("Unsupported operating system")
 
-# Construct the full path to the library
-lib_path = os.path.join(current_dir, lib_name)
+def load_library():
+    # Determine the current working directory
+    current_dir = os.getcwd()
+
+    # Determine the platform and set the appropriate library name
+    platform_system = platform.system()
+    if platform_system == "Windows":
+        lib_name = "librisdk.dll"
+    elif platform_system == "Linux":
+        lib_name = "librisdk.so"
+    else:
+        raise OSError("Unsupported operating system")
+
+    # Construct the full path to the library
+    lib_path = os.path.join(current_dir, lib_name)
+
+    # Load the library
+    try:
+        lib = ctypes.CDLL(lib_path)
+        print(f"Successfully loaded library from: {lib_path}")
+    except OSError as e:
+        print(f"Error loading the library: {e}")
+        print(f"Attempted to load from: {lib_path}")
+        raise
+    return lib
+
+
+def set_backend(backend):
+    """Replace the SDK used by all functions of this module"""
+    global lib
+    lib = backend
 
-# Load the library
-try:
-    lib = ctypes.CDLL(lib_path)
-    print(f"Successfully loaded library from: {lib_path}")
-except OSError as e:
-    print(f"Error loading the library: {e}")
-    print(f"Attempted to load from: {lib_path}")
-    raise
+
+# Loaded on first use, importing this module must not load the driver (the audio processes import it too)
+lib = None
+_library_lock = threading.Lock()
+
+def get_library():
+    """SDK used by all functions of this module, the simulated one with RISDK_BACKEND=sim"""
+    global lib
+    with _library_lock:
+        if lib is None:
+            lib = SimulatedSDK() if os.environ.get("RISDK_BACKEND") == "sim" else load_library()
+        return lib
 
 
 # In[ ]:
@@ -42,84 +112,29 @@ MAX_ANGLE = 180
 
 # Initialize the SDK
 def init_sdk():
-    errTextC = create_string_buffer(1000)
-    errCode = lib.RI_SDK_InitSDK(2, errTextC)
-    if errCode != 0:
-        raise Exception(f"Failed to initialize SDK: {errTextC.value.decode()}")
+    default_arm.init_sdk()
 
 # Create and initialize components
 def init_components():
-    errTextC = create_string_buffer(1000)
-    
-    # Create PWM
-    pwm = c_int()
-    errCode = lib.RI_SDK_CreateModelComponent("connector".encode(), "pwm".encode(), "pca9685".encode(), byref(pwm), errTextC)
-    if errCode != 0:
-        raise Exception(f"Failed to create PWM: {errTextC.value.decode()}")
-    
-    # Create I2C
-    i2c = c_int()
-    errCode = lib.RI_SDK_CreateModelComponent("connector".encode(), "i2c_adapter".encode(), "ch341".encode(), byref(i2c), errTextC)
-    if errCode != 0:
-        raise Exception(f"Failed to create I2C: {errTextC.value.decode()}")
-    
-    # Link PWM to I2C
-    errCode = lib.RI_SDK_LinkPWMToController(pwm, i2c, c_uint8(0x40), errTextC)
-    if errCode != 0:
-        raise Exception(f"Failed to link PWM to I2C: {errTextC.value.decode()}")
-    
-    # Create and link servos
-    servos = []
-    for i in range(SERVO_COUNT):
-        servo = c_int()
-        errCode = lib.RI_SDK_CreateModelComponent("executor".encode(), "servodrive".encode(), "mg90s".encode(), byref(servo), errTextC)
-        if errCode != 0:
-            raise Exception(f"Failed to create servo {i}: {errTextC.value.decode()}")
-        
-        errCode = lib.RI_SDK_LinkServodriveToController(servo, pwm, i, errTextC)
-        if errCode != 0:
-            raise Exception(f"Failed to link servo {i}: {errTextC.value.decode()}")
-        
-        servos.append(servo)
-    
-    return servos
-
-positions = {}
+    return default_arm.init_components()
 
 # Move a servo to a specific position
 def move_servo(servo, position):
-    errTextC = create_string_buffer(1000)
-    safe_position = max(MIN_PULSE, min(MAX_PULSE, position))
-    errCode = lib.RI_SDK_exec_ServoDrive_TurnByPulse(servo, safe_position, errTextC)
-    if errCode != 0:
-        raise Exception(f"Failed to move servo: {errTextC.value.decode()}")
-    positions[servo.value] = position
-
-def move_servo_slow(servo, position):
-    if position > positions[servo.value]:
-        for i in range(positions[servo.value], position, 1):
-            move_servo(servo, i)
-            time.sleep(0.01)
-        move_servo(servo, position)
-    elif position < positions[servo.value]:
-        for i in range(positions[servo.value], position, -1):
-            move_servo(servo, i)
-            time.sleep(0.01)
-        move_servo(servo, position)
-
-# Move a servo to a specific position with speed control
+    default_arm.move_servo(servo, position)
+
+def move_servo_slow(servo, position, cancel=None):
+    default_arm.move_servo_slow(servo, position, cancel)
+
 def move_servo_speed(servo, pulse, speed):
-    errTextC = create_string_buffer(1000)
-    angle = pulse_to_angle(pulse)
-    safe_angle = max(MIN_ANGLE, min(MAX_ANGLE, angle))
-    errCode = lib.RI_SDK_exec_ServoDrive_Turn(servo, int(safe_angle), speed, c_bool(False), errTextC)
-    if errCode != 0:
-        raise Exception(f"Failed to move servo: {errTextC.value.decode()}")
+    default_arm.move_servo_speed(servo, pulse, speed)
 
 # Convert pulse to angle
 def pulse_to_angle(pulse):
     return (pulse - MIN_PULSE) / ((MAX_PULSE - MIN_PULSE) / 180) - 90
 
+def angle_to_pulse(angle):
+    return (angle + 90) * ((MAX_PULSE - MIN_PULSE) / 180) + MIN_PULSE
+
 
 # Main function
 def main():
@@ -140,57 +155,21 @@ def main():
 # In[ ]:
 
 
-def move_two_servos_sync(servos, r0, r1, r2):
+def move_two_servos_sync(servos, r0, r1, r2, cancel=None):
     """
     Move servo 1 and 2 simultaneously, completing movement at the same time.
-    
+
     Args:
-        servos: List of servo objects
+        servos: List of servo objects of the default arm
         r1: Target position for servo 1 (float)
         r2: Target position for servo 2 (float)
+        cancel: Optional CancellationToken, checked at every 10 ms step
     """
-    # Get current positions
-    start1 = positions[servos[1].value]
-    start2 = positions[servos[2].value]
-    
-    # Calculate distances to move
-    dist1 = abs(r1 - start1)
-    dist2 = abs(r2 - start2)
-
-    if r1 <= start1:
-        move_servo_slow(servos[0], r0)
-        
-    # Find which movement is larger to determine number of steps
-    max_dist = max(dist1, dist2)
-    
-    if max_dist != 0:    
-        # Calculate step sizes for each servo to ensure synchronized completion
-        step1 = (r1 - start1) / max_dist
-        step2 = (r2 - start2) / max_dist
-        
-        # Move servos step by step
-        for i in range(int(max_dist)):
-            new_pos1 = start1 + step1 * i
-            new_pos2 = start2 + step2 * i
-            
-            # Move both servos
-            move_servo(servos[1], int(new_pos1))
-            move_servo(servos[2], int(new_pos2))
-            
-            # Use same delay as move_servo_slow
-            time.sleep(0.01)
-        
-        # Final movement to ensure target positions are exactly reached
-        move_servo(servos[1], int(r1))
-        move_servo(servos[2], int(r2))
-    if r1 > start1:
-        move_servo_slow(servos[0], r0)
+    default_arm.move_two_servos_sync(r0, r1, r2, cancel, servos)
 
-    
 
 def execute_move_command(r):
-    move_two_servos_sync(servos, r[0], r[1], r[2])
-    move_servo_slow(servos[6], r[6])
+    default_arm.execute_move_command(r)
 
 
 grid_positions = {
@@ -232,15 +211,229 @@ grid_positions = {
     }
 }
 
-def execute_string_command(target_arm_position, target_arm_height, gripper):
-    if target_arm_height == "raised":
-        r = grid_positions[target_arm_position]['up']
-    elif target_arm_height == "lowered":
-        r = grid_positions[target_arm_position]['down']
-    else:
-        raise Exception(f"Wrong target_arm_height: {target_arm_height}")
-    gripper_pos = 1650
-    if gripper == "close" or gripper == "hold":
-        gripper_pos = 1950
-    move_two_servos_sync(servos, r[0], r[1], r[2])
-    move_servo_slow(servos[6], gripper_pos)
+# Arm raised above the grid, position at startup
+SAFE_POSE = (1450, 1825, 1450)
+
+def move_to_safe_pose():
+    """Raise the arm out of the way, the gripper keeps what it holds"""
+    default_arm.move_to_safe_pose()
+
+def execute_string_command(target_arm_position, target_arm_height, gripper, cancel=None):
+    default_arm.execute_string_command(target_arm_position, target_arm_height, gripper, cancel)
+
+
+# Backends whose SDK was initialized, weak so a collected backend is not mistaken for a new one
+_initialized_backends = weakref.WeakSet()
+_init_lock = threading.Lock()
+
+
+class Arm:
+    """
+    One arm with its own SDK component handles, servo positions and calibration.
+
+    Several arms can be driven from one process: each one gets its own PWM board (I2C address of
+    the PCA9685) or its own SDK backend, such as a SimulatedSDK per arm. The module level functions
+    operate on default_arm.
+
+    Args:
+        name (str): Name used in logs, traces and command routing
+        backend: SDK to use, the module level SDK (see set_backend) if None
+        calibration (dict): Servo pulses per grid square and height, grid_positions by default
+        i2c_address (int): Address of the PCA9685 PWM board of this arm
+        safe_pose (tuple): Pulses of servos 0-2 with the arm raised out of the way
+    """
+
+    def __init__(self, name="arm", backend=None, calibration=None, i2c_address=0x40, safe_pose=SAFE_POSE):
+        self.name = name
+        self.backend = backend
+        self.calibration = calibration if calibration is not None else grid_positions
+        self.i2c_address = i2c_address
+        self.safe_pose = safe_pose
+        self.servos = []
+        self.positions = {}
+
+    @property
+    def lib(self):
+        return self.backend if self.backend is not None else get_library()
+
+    def init_sdk(self):
+        # The SDK is initialized once per backend, arms sharing it only create their own components
+        with _init_lock:
+            if self.lib in _initialized_backends:
+                return
+            errTextC = create_string_buffer(1000)
+            errCode = self.lib.RI_SDK_InitSDK(2, errTextC)
+            if errCode != 0:
+                raise Exception(f"Failed to initialize SDK: {errTextC.value.decode()}")
+            _initialized_backends.add(self.lib)
+
+    def init_components(self):
+        errTextC = create_string_buffer(1000)
+
+        # Create PWM
+        pwm = c_int()
+        errCode = self.lib.RI_SDK_CreateModelComponent("connector".encode(), "pwm".encode(), "pca9685".encode(), byref(pwm), errTextC)
+        if errCode != 0:
+            raise Exception(f"Failed to create PWM: {errTextC.value.decode()}")
+
+        # Create I2C
+        i2c = c_int()
+        errCode = self.lib.RI_SDK_CreateModelComponent("connector".encode(), "i2c_adapter".encode(), "ch341".encode(), byref(i2c), errTextC)
+        if errCode != 0:
+            raise Exception(f"Failed to create I2C: {errTextC.value.decode()}")
+
+        # Link PWM to I2C
+        errCode = self.lib.RI_SDK_LinkPWMToController(pwm, i2c, c_uint8(self.i2c_address), errTextC)
+        if errCode != 0:
+            raise Exception(f"Failed to link PWM to I2C: {errTextC.value.decode()}")
+
+        # Create and link servos
+        self.servos.clear()
+        for i in range(SERVO_COUNT):
+            servo = c_int()
+            errCode = self.lib.RI_SDK_CreateModelComponent("executor".encode(), "servodrive".encode(), "mg90s".encode(), byref(servo), errTextC)
+            if errCode != 0:
+                raise Exception(f"Failed to create servo {i}: {errTextC.value.decode()}")
+
+            errCode = self.lib.RI_SDK_LinkServodriveToController(servo, pwm, i, errTextC)
+            if errCode != 0:
+                raise Exception(f"Failed to link servo {i}: {errTextC.value.decode()}")
+
+            self.servos.append(servo)
+
+        return self.servos
+
+    def start(self):
+        """Initialize the arm and move it to the startup position"""
+        self.init_sdk()
+        servos = self.init_components()
+        self.move_servo(servos[0], 1450)
+        self.move_servo(servos[1], 1825)
+        self.move_servo(servos[2], 1450)
+        self.move_servo(servos[6], 1950)
+
+        self.move_two_servos_sync(1450, 1825, 1450)
+        self.move_servo_slow(servos[6], 1950)
+        return self
+
+    def shutdown(self):
+        """Park the arm"""
+        self.move_two_servos_sync(1500, 1750, 1750)
+        self.move_servo(self.servos[6], 1950)
+
+    # Move a servo to a specific position
+    def move_servo(self, servo, position):
+        errTextC = create_string_buffer(1000)
+        safe_position = max(MIN_PULSE, min(MAX_PULSE, position))
+        errCode = self.lib.RI_SDK_exec_ServoDrive_TurnByPulse(servo, safe_position, errTextC)
+        if errCode != 0:
+            raise Exception(f"Failed to move servo: {errTextC.value.decode()}")
+        self.positions[servo.value] = position
+
+    def move_servo_slow(self, servo, position, cancel=None):
+        positions = self.positions
+        if position > positions[servo.value]:
+            for i in range(positions[servo.value], position, 1):
+                self.move_servo(servo, i)
+                sleep(0.01, cancel)
+            self.move_servo(servo, position)
+        elif position < positions[servo.value]:
+            for i in range(positions[servo.value], position, -1):
+                self.move_servo(servo, i)
+                sleep(0.01, cancel)
+            self.move_servo(servo, position)
+
+    # Move a servo to a specific position with speed control
+    def move_servo_speed(self, servo, pulse, speed):
+        errTextC = create_string_buffer(1000)
+        angle = pulse_to_angle(pulse)
+        safe_angle = max(MIN_ANGLE, min(MAX_ANGLE, angle))
+        errCode = self.lib.RI_SDK_exec_ServoDrive_Turn(servo, int(safe_angle), speed, c_bool(False), errTextC)
+        if errCode != 0:
+            raise Exception(f"Failed to move servo: {errTextC.value.decode()}")
+
+    def move_two_servos_sync(self, r0, r1, r2, cancel=None, servos=None):
+        """
+        Move servo 1 and 2 simultaneously, completing movement at the same time.
+
+        Args:
+            r0: Target position for servo 0, moved before lowering or after raising the arm
+            r1: Target position for servo 1 (float)
+            r2: Target position for servo 2 (float)
+            cancel: Optional CancellationToken, checked at every 10 ms step
+            servos: Servo objects to move, the servos of this arm if None
+        """
+        servos = servos if servos is not None else self.servos
+        positions = self.positions
+
+        # Get current positions
+        start1 = positions[servos[1].value]
+        start2 = positions[servos[2].value]
+
+        # Calculate distances to move
+        dist1 = abs(r1 - start1)
+        dist2 = abs(r2 - start2)
+
+        if r1 <= start1:
+            self.move_servo_slow(servos[0], r0, cancel)
+
+        # Find which movement is larger to determine number of steps
+        max_dist = max(dist1, dist2)
+
+        if max_dist != 0:
+            # Calculate step sizes for each servo to ensure synchronized completion
+            step1 = (r1 - start1) / max_dist
+            step2 = (r2 - start2) / max_dist
+
+            # Move servos step by step
+            for i in range(int(max_dist)):
+                new_pos1 = start1 + step1 * i
+                new_pos2 = start2 + step2 * i
+
+                # Move both servos
+                self.move_servo(servos[1], int(new_pos1))
+                self.move_servo(servos[2], int(new_pos2))
+
+                # Use same delay as move_servo_slow
+                sleep(0.01, cancel)
+
+            # Final movement to ensure target positions are exactly reached
+            self.move_servo(servos[1], int(r1))
+            self.move_servo(servos[2], int(r2))
+        if r1 > start1:
+            self.move_servo_slow(servos[0], r0, cancel)
+
+    def execute_move_command(self, r):
+        self.move_two_servos_sync(r[0], r[1], r[2])
+        self.move_servo_slow(self.servos[6], r[6])
+
+    def move_to_safe_pose(self):
+        """Raise the arm out of the way, the gripper keeps what it holds"""
+        self.move_two_servos_sync(*self.safe_pose)
+
+    def execute_string_command(self, target_arm_position, target_arm_height, gripper, cancel=None):
+        if target_arm_height == "raised":
+            r = self.calibration[target_arm_position]['up']
+        elif target_arm_height == "lowered":
+            r = self.calibration[target_arm_position]['down']
+        else:
+            raise Exception(f"Wrong target_arm_height: {target_arm_height}")
+        gripper_pos = 1650
+        if gripper == "close" or gripper == "hold":
+            gripper_pos = 1950
+        with span("servo.arm", arm=self.name, target=target_arm_position, height=target_arm_height):
+            self.move_two_servos_sync(r[0], r[1], r[2], cancel)
+        with span("servo.gripper", arm=self.name, gripper=gripper):
+            self.move_servo_slow(self.servos[6], gripper_pos, cancel)
+
+
+def load_calibration(path):
+    """Read a calibration table in the format of grid_positions from a JSON file"""
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+# Arm used by the module level functions
+default_arm = Arm()
+servos = default_arm.servos
+positions = default_arm.positions
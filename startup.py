@@ -0,0 +1,81 @@
+import time
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+from tracing import tracer
+
+
+class Startup:
+    """
+    Initializes independent subsystems concurrently and records when each one started and finished.
+
+    Tasks are added with the names of the tasks they depend on; a task starts as soon as its
+    dependencies are done and receives their results as arguments.
+    """
+
+    def __init__(self, max_workers=8):
+        self.start_time = time.perf_counter()
+        self.start_ns = time.perf_counter_ns()
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="startup")
+        self.lock = threading.Lock()
+        self.futures = {}
+        self.timeline = {}  # name -> (start, end) in seconds since the startup began
+        self.milestones = {}
+
+    def add(self, name, function, *dependencies):
+        """Schedule function(*results of dependencies) under the given name"""
+        dependency_futures = [self.futures[d] for d in dependencies]
+
+        def run():
+            args = [future.result() for future in dependency_futures]
+            start_ns = time.perf_counter_ns()
+            try:
+                return function(*args)
+            finally:
+                end_ns = time.perf_counter_ns()
+                tracer.complete(f"startup.{name}", start_ns, end_ns)
+                with self.lock:
+                    self.timeline[name] = ((start_ns - self.start_ns) / 1e9, (end_ns - self.start_ns) / 1e9)
+
+        self.futures[name] = self.executor.submit(run)
+        return self.futures[name]
+
+    def get(self, name):
+        """Result of a finished task, None if it failed or does not exist"""
+        future = self.futures.get(name)
+        if future is None or not future.done() or future.exception() is not None:
+            return None
+        return future.result()
+
+    def wait(self):
+        """Wait for all tasks, raises the first failure after every task has finished"""
+        error = None
+        for name, future in self.futures.items():
+            try:
+                future.result()
+            except Exception as e:
+                print(f"Startup of {name} failed: {e}")
+                traceback.print_exc()
+                error = error or e
+        self.executor.shutdown(wait=False)
+        if error is not None:
+            raise error
+        return {name: future.result() for name, future in self.futures.items()}
+
+    def mark(self, name):
+        """Record a point in time, such as when the robot started listening"""
+        self.milestones[name] = time.perf_counter() - self.start_time
+
+    def report(self, width=40):
+        """Print the startup timeline"""
+        with self.lock:
+            timeline = sorted(self.timeline.items(), key=lambda item: item[1][0])
+        end = max([t[1][1] for t in timeline] + list(self.milestones.values()) + [1e-9])
+        print("Startup timeline:")
+        for name, (start, finish) in timeline:
+            left = int(start / end * width)
+            bar = " " * left + "#" * max(1, int(finish / end * width) - left)
+            print(f"  {name:<10} {start:7.2f}s - {finish:7.2f}s |{bar:<{width}}|")
+        for name, at in sorted(self.milestones.items(), key=lambda item: item[1]):
+            print(f"  {name:<10} {at:7.2f}s")
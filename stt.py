@@ -1,21 +1,35 @@
+import re
 import numpy as np
-import torch
-import pyaudio
 import threading
 import traceback
 import time
 from queue import Queue, Empty as QueueEmpty
 from dataclasses import dataclass
-from scipy.io.wavfile import write
+from typing import Optional
+from events import EventBus, COMMAND_READY, PAUSED, RESUMED, STOPPED
+from tracing import tracer, span
 
 @dataclass
 class VoiceCommand:
     text: str
     speed: float = 1.25
+    priority: int = 1  # A command preempts a running episode of lower priority
+    arm: Optional[str] = None  # Name of the arm that executes the command, the first arm if None
+    preempt: bool = False  # Also preempts a running episode of the same priority
+
+# First words of spoken commands that replace the running episode, other voice commands wait for it
+STOP_WORDS = {"stop", "cancel", "стоп", "отмена", "отмени", "хватит"}
+
+def is_stop_command(text: str) -> bool:
+    words = re.findall(r"\w+", text.lower())
+    return bool(words) and words[0] in STOP_WORDS
 
 class VoiceActivityDetection:
     def __init__(self, sampling_rate=16000):
         print("Initializing VAD...")
+        # Imported here, torch takes seconds to import and is only needed once VAD starts
+        import torch
+        self.torch = torch
         self.model, utils = torch.hub.load(
             repo_or_dir="snakers4/silero-vad",
             model="silero_vad"
@@ -52,7 +66,7 @@ class VoiceActivityDetection:
                 frames = frames.flatten()
                 
             # Convert to torch tensor
-            audio = torch.tensor(frames)
+            audio = self.torch.tensor(frames)
             
             # Print tensor information
             #print(f"Tensor shape: {audio.shape}, dtype: {audio.dtype}")
@@ -75,20 +89,108 @@ class VoiceActivityDetection:
             traceback.print_exc()
             return False
 
+class SpeechSegmenter:
+    """State machine that cuts a stream of audio chunks into utterances using VAD"""
+
+    def __init__(self, vad, chunk_size=2048, silence_chunks=16, min_chunks=3):
+        self.vad = vad
+        self.chunk_size = chunk_size
+        self.silence_chunks = silence_chunks
+        self.min_chunks = min_chunks
+        self.reset()
+
+    def reset(self):
+        self.recording = False
+        self.silence_duration = 0
+        self.audio_data = np.empty((0, 1), dtype=np.float32)
+
+    def feed(self, audio_chunk):
+        """
+        Process one chunk of shape (n, 1).
+
+        Returns:
+            The audio of a finished utterance or None
+        """
+        # Convert audio chunk to bytes for VAD
+        audio_bytes = audio_chunk.astype(np.float32).tobytes()
+
+        with span("stt.vad"):
+            is_speech = self.vad.contains_speech(audio_bytes)
+
+        # State machine for recording
+        if not self.recording and is_speech:
+            self.recording = True
+            self.audio_data = audio_chunk
+            self.silence_duration = 0
+            self.speech_start_ns = time.perf_counter_ns()
+            print("Speech detected, started recording")
+        elif self.recording:
+            self.audio_data = np.concatenate((self.audio_data, audio_chunk))
+
+            if not is_speech:
+                self.silence_duration += 1
+                if self.silence_duration > self.silence_chunks:
+                    segment = self.audio_data
+                    self.reset()
+                    if len(segment) > self.chunk_size * self.min_chunks:  # Minimum length
+                        # From the first speech chunk until the end of the utterance was detected
+                        tracer.complete("stt.endpointing", self.speech_start_ns, time.perf_counter_ns(),
+                                        samples=len(segment))
+                        return segment
+        return None
+
+
+def transcribe_audio(client, audio_data, sample_rate=16000):
+    """
+    Transcribe an utterance with OpenAI's Whisper API.
+
+    Returns:
+        str: The detected command or None if nothing usable was said
+    """
+    from scipy.io.wavfile import write
+
+    # Create an audio segment in-memory with appropriate settings
+    raw_filename = "raw.wav"
+    write(raw_filename, sample_rate, audio_data)
+
+    with open(raw_filename, "rb") as audio_file, span("stt.transcription", samples=len(audio_data)):
+        # Send the audio file to OpenAI's Whisper API for transcription
+        transcription = client.audio.transcriptions.create(
+            model="whisper-1",
+            file=audio_file,
+            language="ru"
+        )
+    print(transcription)
+
+    # Extract transcribed text from the response
+    transcribed_text = transcription.text.strip()
+
+    # Print the detected command if valid
+    if transcribed_text and len(transcribed_text) > 3:
+        print(f"Detected command: {transcribed_text}")
+        return transcribed_text
+    return None
+
+
 class WhisperCommandQueue:
-    def __init__(self, tts_queue, silence_threshold=5):
+    def __init__(self, tts_queue, silence_threshold=5, event_bus=None, client=None):
         self.queue = Queue()
         self.is_running = True
         self.silence_threshold = silence_threshold
         self.tts_queue = tts_queue
+        # Share the TTS bus so listening is blocked while the robot speaks
+        self.event_bus = event_bus or getattr(tts_queue, 'event_bus', None) or EventBus()
+        self.client = client
         self.vad = VoiceActivityDetection()
         self.sample_rate = 16000
         self.chunk_size = 2048
+        self.segmenter = SpeechSegmenter(self.vad, self.chunk_size)
         self.is_paused = False  # New flag for pause state
         self.pause_lock = threading.Lock()  # Lock for thread-safe pause state management
        
         
         # Initialize PyAudio stream
+        import pyaudio
         self.p = pyaudio.PyAudio()
         self.stream = self.p.open(
             format=pyaudio.paFloat32,
@@ -109,40 +211,53 @@ class WhisperCommandQueue:
         with self.pause_lock:
             self.is_paused = True
             print("Command queue paused")
+        self.event_bus.publish(PAUSED)
     
     def resume(self):
         """Resume the command queue processing"""
         with self.pause_lock:
             self.is_paused = False
             print("Command queue resumed")
+        self.event_bus.publish(RESUMED)
     
     def toggle_pause(self):
         """Toggle the pause state"""
         with self.pause_lock:
             self.is_paused = not self.is_paused
-            print(f"Command queue {'paused' if self.is_paused else 'resumed'}")
+            paused = self.is_paused
+            print(f"Command queue {'paused' if paused else 'resumed'}")
+        self.event_bus.publish(PAUSED if paused else RESUMED)
     
-    def get_command(self, timeout=None):
-        """Get the next command from the queue"""
+    def get_command(self, timeout=1.0):
+        """
+        Get the next command from the queue, blocks until one is ready or the timeout expires.
+
+        Callers loop while is_running. The wait is bounded because an untimed lock wait cannot be
+        interrupted by Ctrl+C on Windows.
+        """
+        self.event_bus.wait_for(lambda: not self.queue.empty() or not self.is_running, timeout)
         try:
-            return self.queue.get(timeout=timeout)
+            command = self.queue.get_nowait()
         except QueueEmpty:
             return None
+        tracer.counter("stt.queue_depth", self.queue.qsize())
+        return command
+
+    def _should_listen(self):
+        """Called with the bus lock held"""
+        return not self.is_paused and not self.event_bus.flags["speaking"]
     
     def _process_audio_stream(self):
-        recording = False
-        silence_duration = 0
-        audio_data = np.empty((0, 1), dtype=np.float32)
-        
         while self.is_running:
-            with self.pause_lock:
-                if self.is_paused:
-                    time.sleep(0.1)  # Sleep briefly when paused to reduce CPU usage
-                    continue
-                    
-            if hasattr(self.tts_queue, 'is_speaking') and self.tts_queue.is_speaking:
-                time.sleep(0.5)
-                continue
+            if not self.event_bus.wait_for(lambda: self._should_listen() or not self.is_running, timeout=0):
+                # Block until resumed and the robot stopped speaking
+                while not self.event_bus.wait_for(lambda: self._should_listen() or not self.is_running, timeout=1.0):
+                    pass
+                if not self.is_running:
+                    break
+                # Drop the audio captured while we were not listening
+                self._discard_buffered_audio()
+                self.segmenter.reset()
             
             try:
                 # Read from stream
@@ -151,27 +266,9 @@ class WhisperCommandQueue:
                     dtype=np.float32
                 ).reshape(-1, 1)
                 
-                # Convert audio chunk to bytes for VAD
-                audio_bytes = audio_chunk.astype(np.float32).tobytes()
-                
-                is_speech = self.vad.contains_speech(audio_bytes)
-                
-                # State machine for recording
-                if not recording and is_speech:
-                    recording = True
-                    audio_data = audio_chunk
-                    silence_duration = 0
-                    print("Speech detected, started recording")
-                elif recording:
-                    audio_data = np.concatenate((audio_data, audio_chunk))
-                    
-                    if not is_speech:
-                        silence_duration += 1
-                        if silence_duration > 16:
-                            if len(audio_data) > self.chunk_size * 3:  # Minimum length
-                                self._process_audio_segment(audio_data)
-                            recording = False
-                            audio_data = np.empty((0, 1), dtype=np.float32)
+                segment = self.segmenter.feed(audio_chunk)
+                if segment is not None:
+                    self._process_audio_segment(segment)
                         
             except Exception as e:
                 traceback.print_exc()
@@ -179,38 +276,32 @@ class WhisperCommandQueue:
                 time.sleep(0.1)
                 continue
     
+    def _discard_buffered_audio(self):
+        available = self.stream.get_read_available()
+        if available > 0:
+            self.stream.read(available, exception_on_overflow=False)
+
     def _process_audio_segment(self, audio_data):
         try:
-            # Create an audio segment in-memory with appropriate settings
-            raw_filename = "raw.wav"
-            write(raw_filename, self.sample_rate, audio_data)
-
-            audio_file = open( "raw.wav", "rb")
-            
-            # Send the audio file to OpenAI's Whisper API for transcription
-            transcription = openai_client.audio.transcriptions.create(
-                model="whisper-1", 
-                file=audio_file,
-                language="ru"
-            )
-            print(transcription)
-    
-            # Extract transcribed text from the response
-            transcribed_text = transcription.text.strip()
-    
-            # Print the detected command if valid
-            if transcribed_text and len(transcribed_text) > 3:
-                print(f"Detected command: {transcribed_text}")
-                self.queue.put(VoiceCommand(text=transcribed_text, speed=1.2))
+            transcribed_text = transcribe_audio(self.client, audio_data, self.sample_rate)
+            if transcribed_text:
+                self._put_command(transcribed_text)
     
         except Exception as e:
             traceback.print_exc()
             print(f"Error processing audio segment: {e}")
 
+    def _put_command(self, text):
+        # Servo noise transcribed as speech must not cancel the running episode, only a stop command does
+        self.queue.put(VoiceCommand(text=text, speed=1.2, preempt=is_stop_command(text)))
+        tracer.counter("stt.queue_depth", self.queue.qsize())
+        self.event_bus.publish(COMMAND_READY)
+
     
     def stop(self):
         """Safely stop the command queue"""
         self.is_running = False
+        self.event_bus.publish(STOPPED)
         if hasattr(self, 'stream') and self.stream:
             self.stream.stop_stream()
             self.stream.close()
@@ -0,0 +1,72 @@
+import threading
+
+import numpy as np
+import pytest
+
+from audio_process import SharedAudioRing
+
+
+@pytest.fixture
+def ring():
+    ring = SharedAudioRing(8, threading.Condition())
+    yield ring
+    ring.release()
+
+
+def samples(start, count):
+    return np.arange(start, start + count, dtype=np.float32)
+
+
+def test_read_across_the_end_of_the_buffer(ring):
+    position = 0
+    for start in range(0, 30, 3):
+        ring.write(samples(start, 3))
+        chunk, position = ring.read(position, 3, timeout=0)
+        assert chunk.tolist() == samples(start, 3).tolist()
+    assert position == ring.write_position() == 30
+
+
+def test_samples_stay_valid_after_the_writer_moves_on(ring):
+    ring.write(samples(0, 6))
+    chunk, _ = ring.read(2, 4, timeout=0)
+    ring.write(samples(6, 8))
+    assert chunk.tolist() == [2, 3, 4, 5]
+
+
+def test_lapped_reader_skips_to_the_oldest_samples(ring):
+    ring.write(samples(0, 5))
+    ring.write(samples(5, 5))
+    ring.write(samples(10, 5))
+    chunk, position = ring.read(0, 4, timeout=0)
+    assert chunk.tolist() == [7, 8, 9, 10]
+    assert position == 11
+
+
+def test_write_larger_than_capacity_keeps_the_newest_samples(ring):
+    ring.write(samples(0, 20))
+    chunk, position = ring.read(12, 8, timeout=0)
+    assert chunk.tolist() == samples(12, 8).tolist()
+    assert position == 20
+
+
+def test_read_waits_for_the_writer(ring):
+    def write():
+        for start in range(0, 12, 2):
+            ring.write(samples(start, 2))
+
+    thread = threading.Thread(target=write)
+    thread.start()
+    position, read = 0, []
+    while position < 12:
+        chunk, position = ring.read(position, 4, timeout=5)
+        read.extend(chunk.tolist())
+    thread.join()
+    # The reader may have been lapped, whatever it got is in order and untorn
+    assert read == sorted(read) and read[-1] == 11
+
+
+def test_timeout_and_close(ring):
+    ring.write(samples(0, 2))
+    assert ring.read(0, 4, timeout=0.01) == (None, 0)
+    ring.close()
+    assert ring.read(0, 2, timeout=0) == (None, 0)
@@ -0,0 +1,87 @@
+import socket
+
+from commands import CommandScheduler, CommandServer
+from stt import VoiceCommand
+
+
+def start(scheduler, command):
+    scheduler.submit(command)
+    assert scheduler.next(timeout=0) is command
+    return scheduler.begin(command)
+
+
+def test_higher_priority_preempts():
+    scheduler = CommandScheduler()
+    token = start(scheduler, VoiceCommand("pick up the cube", priority=1))
+    scheduler.submit(VoiceCommand("stop", priority=5))
+    assert token.cancelled
+    assert "stop" in token.reason
+
+
+def test_equal_priority_waits():
+    scheduler = CommandScheduler()
+    token = start(scheduler, VoiceCommand("pick up the cube"))
+    scheduler.submit(VoiceCommand("servo noise"))
+    assert not token.cancelled
+
+
+def test_equal_priority_with_preempt_replaces():
+    scheduler = CommandScheduler()
+    token = start(scheduler, VoiceCommand("pick up the cube"))
+    scheduler.submit(VoiceCommand("стоп", preempt=True))
+    assert token.cancelled
+
+
+def test_lower_priority_never_preempts():
+    scheduler = CommandScheduler()
+    token = start(scheduler, VoiceCommand("stop", priority=5))
+    scheduler.submit(VoiceCommand("pick up the cube", priority=1, preempt=True))
+    assert not token.cancelled
+
+
+def test_no_preemption_after_finish():
+    scheduler = CommandScheduler()
+    token = start(scheduler, VoiceCommand("pick up the cube"))
+    scheduler.finish()
+    scheduler.submit(VoiceCommand("stop", priority=5))
+    assert not token.cancelled
+
+
+def test_next_orders_by_priority_then_arrival():
+    scheduler = CommandScheduler()
+    for text, priority in [("a", 1), ("b", 3), ("c", 1), ("d", 3)]:
+        scheduler.submit(VoiceCommand(text, priority=priority))
+    order = []
+    for _ in range(4):
+        order.append(scheduler.next(timeout=0).text)
+        scheduler.finish()
+    assert order == ["b", "d", "a", "c"]
+    assert scheduler.next(timeout=0) is None
+
+
+def test_stop_cancels_running_episode():
+    scheduler = CommandScheduler()
+    token = start(scheduler, VoiceCommand("pick up the cube"))
+    scheduler.stop()
+    assert token.cancelled
+    assert not scheduler.is_running
+
+
+def test_server_answers_every_line():
+    scheduler = CommandScheduler()
+    server = CommandServer(scheduler, port=0).start()
+    try:
+        with socket.create_connection(server.server.server_address, timeout=5) as connection:
+            connection.sendall(b'{"text": "stop", "priority": 5, "arm": "left"}\n'
+                               b'{"text": "stop", "priority": null}\n'
+                               b'\xff\xfe\n'
+                               b'pick up the cube\n')
+            replies = connection.makefile("rb")
+            answers = [replies.readline().strip() for _ in range(4)]
+    finally:
+        server.stop()
+    assert answers[0] == b"ok" and answers[3] == b"ok"
+    assert answers[1].startswith(b"error:") and answers[2].startswith(b"error:")
+    first = scheduler.next(timeout=0)
+    assert (first.text, first.priority, first.arm, first.preempt) == ("stop", 5, "left", True)
+    assert scheduler.next(timeout=0).preempt
@@ -0,0 +1,88 @@
+import threading
+import time
+
+from cancellation import CancellationToken, Cancelled
+from orchestrator import FairRateLimiter
+
+
+def wait_for_waiting(limiter, count):
+    deadline = time.monotonic() + 5
+    while len(limiter.waiting) < count:
+        assert time.monotonic() < deadline, "arm did not start waiting"
+        time.sleep(0.001)
+
+
+def start_waiting(limiter, names, granted):
+    """Start one acquiring thread per name, each queued after the previous one"""
+    def acquire(name):
+        limiter.acquire(name)
+        granted.append(name)
+
+    threads = []
+    for name in names:
+        thread = threading.Thread(target=acquire, args=(name,))
+        thread.start()
+        wait_for_waiting(limiter, len(threads) + 1)
+        threads.append(thread)
+    return threads
+
+
+def test_requests_are_granted_in_arrival_order():
+    limiter = FairRateLimiter(requests_per_minute=1200)
+    limiter.tokens = 0
+    granted = []
+    threads = start_waiting(limiter, ["c", "a", "d", "b"], granted)
+    for thread in threads:
+        thread.join(5)
+    assert granted == ["c", "a", "d", "b"]
+    assert {name: stats["requests"] for name, stats in limiter.get_stats().items()} == {"a": 1, "b": 1, "c": 1, "d": 1}
+
+
+def test_arm_queues_behind_waiting_arms():
+    limiter = FairRateLimiter(requests_per_minute=1200)
+    limiter.acquire("left")
+    granted = []
+    threads = start_waiting(limiter, ["right", "left"], granted)
+    for thread in threads:
+        thread.join(5)
+    # left just had a request, right was already waiting for the next one
+    assert granted == ["right", "left"]
+
+
+def test_rate_is_respected():
+    limiter = FairRateLimiter(requests_per_minute=600)
+    start = time.perf_counter()
+    for _ in range(3):
+        limiter.acquire("left")
+    # The first request uses the burst, the others wait 0.1s each
+    assert time.perf_counter() - start >= 0.19
+
+
+def test_cancel_while_waiting_frees_the_queue():
+    limiter = FairRateLimiter(requests_per_minute=60)
+    limiter.tokens = 0
+    cancel = CancellationToken()
+    errors = []
+
+    def acquire():
+        try:
+            limiter.acquire("left", cancel)
+        except Cancelled as ex:
+            errors.append(ex)
+
+    thread = threading.Thread(target=acquire)
+    thread.start()
+    wait_for_waiting(limiter, 1)
+    cancel.cancel("preempted")
+    thread.join(5)
+    assert len(errors) == 1
+    assert not limiter.waiting
+
+
+def test_unlimited_does_not_wait():
+    limiter = FairRateLimiter()
+    start = time.perf_counter()
+    for _ in range(100):
+        limiter.acquire("left")
+    assert time.perf_counter() - start < 1
+    assert limiter.get_stats()["left"]["requests"] == 100
@@ -0,0 +1,61 @@
+import numpy as np
+
+from recorder import EpisodeRecorder, EpisodeReader, list_episodes
+
+
+def record(root, steps=3, end=True):
+    recorder = EpisodeRecorder(root)
+    episode_dir = recorder.start_episode("pick up the cube", arm="left")
+    for step in range(steps):
+        frame = np.full((4, 4, 3), step, dtype=np.uint8)
+        recorder.record_step(step, frame=frame, response=f"response {step}")
+    if end:
+        recorder.end_episode(status="completed")
+    else:
+        # Crash: the file stays open and nothing marks the end
+        recorder.steps_file.close()
+        recorder.steps_file = None
+    return episode_dir
+
+
+def test_read_completed_episode(tmp_path):
+    episode_dir = record(tmp_path)
+    reader = EpisodeReader(episode_dir)
+    assert reader.instruction == "pick up the cube"
+    assert reader.info["arm"] == "left"
+    assert reader.completed
+    assert reader.end["status"] == "completed"
+    assert [step["response"] for step in reader] == ["response 0", "response 1", "response 2"]
+    assert np.asarray(reader.load_frame(2))[0, 0].tolist() == [2, 2, 2]
+    assert list_episodes(tmp_path) == [episode_dir]
+
+
+def test_truncated_last_line_is_ignored(tmp_path):
+    episode_dir = record(tmp_path, end=False)
+    with open(episode_dir / "steps.jsonl", "ab") as f:
+        f.write(b'{"type": "step", "step": 3, "resp')
+    reader = EpisodeReader(episode_dir)
+    assert not reader.completed
+    assert len(reader) == 3
+    assert reader[-1]["step"] == 2
+
+
+def test_truncated_end_record_is_not_completed(tmp_path):
+    episode_dir = record(tmp_path)
+    path = episode_dir / "steps.jsonl"
+    content = path.read_bytes()
+    path.write_bytes(content[:-5])
+    reader = EpisodeReader(episode_dir)
+    assert not reader.completed
+    assert len(reader) == 3
+
+
+def test_corrupt_line_in_the_middle_is_skipped(tmp_path):
+    episode_dir = record(tmp_path)
+    path = episode_dir / "steps.jsonl"
+    lines = path.read_bytes().splitlines(keepends=True)
+    lines[1] = b"{garbage\n"
+    path.write_bytes(b"".join(lines))
+    reader = EpisodeReader(episode_dir)
+    assert [step["step"] for step in reader] == [0, 2]
+    assert reader.completed
@@ -0,0 +1,66 @@
+import os
+
+import numpy as np
+
+from tts import TTSCache
+
+# .npy header plus 100 float32 samples
+ENTRY_BYTES = 128 + 400
+
+
+def put(cache, key, value=0.0):
+    cache.put(key, np.full(100, value, dtype=np.float32), 24000)
+
+
+def test_least_recently_used_entry_is_evicted(tmp_path):
+    cache = TTSCache(tmp_path, max_bytes=2 * ENTRY_BYTES)
+    put(cache, "a")
+    put(cache, "b")
+    assert cache.get("a") is not None
+    put(cache, "c")
+    assert "a" in cache and "c" in cache
+    assert "b" not in cache
+    assert not (tmp_path / "b_24000.npy").exists()
+    assert cache.get_stats()["size_bytes"] == 2 * ENTRY_BYTES
+
+
+def test_get_returns_the_stored_samples(tmp_path):
+    cache = TTSCache(tmp_path)
+    put(cache, "a", 0.5)
+    data, samplerate = cache.get("a")
+    assert samplerate == 24000
+    assert np.allclose(data, 0.5)
+    assert cache.get("missing") is None
+    stats = cache.get_stats()
+    assert (stats["hits"], stats["misses"], stats["bytes_saved"]) == (1, 1, ENTRY_BYTES)
+
+
+def test_replacing_an_entry_does_not_count_it_twice(tmp_path):
+    cache = TTSCache(tmp_path, max_bytes=2 * ENTRY_BYTES)
+    put(cache, "a")
+    put(cache, "a", 1.0)
+    put(cache, "b")
+    assert "a" in cache and "b" in cache
+    assert cache.get_stats()["size_bytes"] == 2 * ENTRY_BYTES
+
+
+def test_entry_larger_than_the_cache_is_kept_alone(tmp_path):
+    cache = TTSCache(tmp_path, max_bytes=ENTRY_BYTES // 2)
+    put(cache, "a")
+    put(cache, "b")
+    assert "a" not in cache and "b" in cache
+
+
+def test_reload_evicts_by_last_use(tmp_path):
+    cache = TTSCache(tmp_path)
+    for index, key in enumerate(["a", "b", "c"]):
+        put(cache, key)
+        os.utime(tmp_path / f"{key}_24000.npy", (1000 + index, 1000 + index))
+    # a was used last
+    os.utime(tmp_path / "a_24000.npy", (2000, 2000))
+    (tmp_path / "stale.tmp").write_bytes(b"partial")
+
+    cache = TTSCache(tmp_path, max_bytes=2 * ENTRY_BYTES)
+    assert "a" in cache and "c" in cache
+    assert "b" not in cache
+    assert not (tmp_path / "stale.tmp").exists()
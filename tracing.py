@@ -0,0 +1,217 @@
+"""
+Lightweight tracing of the agent pipeline.
+
+Spans and counters are kept in memory and exported as a Chrome trace (chrome://tracing, Perfetto)
+per episode and as latency histograms. Disabled unless ROBOT_TRACE=1 or tracer.enable() is called;
+a disabled span() returns a shared no-op context manager.
+"""
+import os
+import json
+import time
+import threading
+from collections import deque
+
+# Upper bounds of the histogram buckets in milliseconds
+HISTOGRAM_BOUNDS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 20000, 60000)
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ("tracer", "name", "args", "start")
+
+    def __init__(self, tracer, name, args):
+        self.tracer = tracer
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.args["error"] = exc_type.__name__
+        self.tracer.complete(self.name, self.start, time.perf_counter_ns(), **self.args)
+        return False
+
+
+class _Context:
+    __slots__ = ("tracer", "args", "previous")
+
+    def __init__(self, tracer, args):
+        self.tracer = tracer
+        self.args = args
+
+    def __enter__(self):
+        local = self.tracer.local
+        self.previous = getattr(local, "args", None)
+        local.args = {**(self.previous or {}), **self.args}
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.tracer.local.args = self.previous
+        return False
+
+
+class _Histogram:
+    def __init__(self, max_samples):
+        self.buckets = [0] * (len(HISTOGRAM_BOUNDS_MS) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.samples = deque(maxlen=max_samples)
+
+    def add(self, duration_ms):
+        index = 0
+        while index < len(HISTOGRAM_BOUNDS_MS) and duration_ms > HISTOGRAM_BOUNDS_MS[index]:
+            index += 1
+        self.buckets[index] += 1
+        self.count += 1
+        self.total_ms += duration_ms
+        self.samples.append(duration_ms)
+
+    def summary(self):
+        ordered = sorted(self.samples)
+
+        def percentile(p):
+            return ordered[min(len(ordered) - 1, max(0, int(round(p / 100 * len(ordered))) - 1))]
+
+        bounds = [str(b) for b in HISTOGRAM_BOUNDS_MS] + ["inf"]
+        return {
+            "count": self.count,
+            "mean_ms": self.total_ms / self.count,
+            "p50_ms": percentile(50),
+            "p90_ms": percentile(90),
+            "p99_ms": percentile(99),
+            "max_ms": ordered[-1],
+            "buckets_ms": dict(zip(bounds, self.buckets))
+        }
+
+
+class Tracer:
+    """Collects spans and counters, timestamps are time.perf_counter_ns()"""
+
+    def __init__(self, enabled=False, max_samples=10000):
+        self.enabled = enabled
+        self.max_samples = max_samples
+        self.lock = threading.Lock()
+        self.events = []
+        self.histograms = {}
+        self.pid = os.getpid()
+        self.local = threading.local()
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def span(self, name, **args):
+        """Context manager timing the enclosed block"""
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name, args)
+
+    def context(self, **args):
+        """Add args, such as arm=..., to every span this thread records inside the block, None values are ignored"""
+        return _Context(self, {key: value for key, value in args.items() if value is not None})
+
+    def get_context(self):
+        """Args of the current context of this thread, to continue it in another thread"""
+        return dict(getattr(self.local, "args", None) or {})
+
+    def complete(self, name, start_ns, end_ns, **args):
+        """Record a span measured elsewhere"""
+        if not self.enabled:
+            return
+        context = getattr(self.local, "args", None)
+        if context:
+            args = {**context, **args}
+        event = {"name": name, "ph": "X", "ts": start_ns / 1000, "dur": (end_ns - start_ns) / 1000,
+                 "pid": self.pid, "tid": threading.get_ident(), "args": args}
+        with self.lock:
+            self.events.append(event)
+            self._add_to_histogram(name, event["dur"] / 1000)
+
+    def counter(self, name, value):
+        """Record the value of a counter such as a queue depth"""
+        if not self.enabled:
+            return
+        event = {"name": name, "ph": "C", "ts": time.perf_counter_ns() / 1000, "pid": self.pid,
+                 "args": {"value": value}}
+        with self.lock:
+            self.events.append(event)
+
+    def _add_to_histogram(self, name, duration_ms):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = _Histogram(self.max_samples)
+        histogram.add(duration_ms)
+
+    def drain(self):
+        """Take the recorded events, used to hand events of a worker process to the main process"""
+        with self.lock:
+            events, self.events = self.events, []
+            return events
+
+    def extend(self, events):
+        """Add events recorded by another process"""
+        if not self.enabled or not events:
+            return
+        with self.lock:
+            self.events.extend(events)
+            for event in events:
+                if event["ph"] == "X":
+                    self._add_to_histogram(event["name"], event["dur"] / 1000)
+
+    def reset(self):
+        """Start a new timeline, histograms keep accumulating"""
+        with self.lock:
+            self.events = []
+
+    def get_histograms(self):
+        with self.lock:
+            return {name: histogram.summary() for name, histogram in sorted(self.histograms.items())}
+
+    def discard_before(self, start_ns):
+        """Drop events that started before start_ns, the part of the timeline no trace needs anymore"""
+        with self.lock:
+            self.events = [event for event in self.events if event["ts"] >= start_ns / 1000]
+
+    def write_chrome_trace(self, path, since_ns=None, arm=None):
+        """
+        Write the current timeline in the Chrome trace event format.
+
+        Args:
+            since_ns (int): Only events that started at or after this time.perf_counter_ns()
+            arm (str): Only events of this arm and events that belong to no arm (voice, queue depths)
+        """
+        with self.lock:
+            events = [event for event in self.events
+                      if (since_ns is None or event["ts"] >= since_ns / 1000)
+                      and (arm is None or event.get("args", {}).get("arm") in (None, arm))]
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f, default=str)
+
+    def write_histograms(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.get_histograms(), f, indent=2)
+
+
+tracer = Tracer(enabled=os.environ.get("ROBOT_TRACE") == "1")
+
+
+def span(name, **args):
+    """Time a block with the global tracer"""
+    if not tracer.enabled:
+        return _NULL_SPAN
+    return _Span(tracer, name, args)
@@ -1,143 +1,623 @@
+import io
 import os
-import threading
+import re
+import json
+import time
+import hashlib
 import tempfile
-import sounddevice as sd
-import soundfile as sf
-from pathlib import Path
-from queue import Queue, Empty as QueueEmpty
+import threading
+import numpy as np
+from queue import Queue, Empty as QueueEmpty, Full as QueueFull
 from threading import Lock
-from dataclasses import dataclass
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from pathlib import Path
 from typing import Optional
+from events import EventBus, SPEECH_STARTED, SPEECH_FINISHED, TTS_IDLE, SPEECH_DONE
+from tracing import tracer, span
 
 @dataclass
 class TTSRequest:
     text: str
     speed: float = 1.0
     voice: str = 'alloy'  # OpenAI voices: alloy, echo, fable, onyx, nova, shimmer
+    generation: int = 0
+    tag: Optional[str] = None  # Speaker of the request, such as an arm, see OpenAITTSQueue.channel()
+    tag_generation: int = 0
+    first_sentence: bool = True  # First sentence of an add_text() call, its playback ends time to first audio
+    submit_time: float = 0.0  # time.time() of the add_text() call
+    submit_ns: int = 0  # time.perf_counter_ns() of the add_text() call for tracing
+
+@dataclass
+class SpeechClip:
+    """Audio of a single request, filled by the synthesis thread while the playback thread consumes it"""
+    request: TTSRequest
+    samplerate: int = 0
+    chunks: Queue = field(default_factory=Queue)  # float32 arrays, None marks the end of the clip
+    start_ns: int = 0  # time.perf_counter_ns() when synthesis started
+    first_chunk_ns: int = 0  # time.perf_counter_ns() when the first audio of the clip was ready
+
+# Raw PCM returned by the OpenAI speech endpoint: 24kHz, 16-bit signed little-endian, mono
+PCM_SAMPLE_RATE = 24000
+PCM_SAMPLE_WIDTH = 2
+
+# Block size used when writing decoded audio, keeps playback cancellable
+PLAYBACK_BLOCK_SECONDS = 0.1
+
+_SENTENCE_END = re.compile(r'(?<=[.!?…])\s+')
+
+
+def split_sentences(text: str):
+    """Split text into sentences on terminal punctuation"""
+    return [s.strip() for s in _SENTENCE_END.split(text) if s.strip()]
+
+
+class TTSCache:
+    """Content-addressed on-disk cache of decoded speech with LRU eviction"""
+
+    def __init__(self, cache_dir='tts-cache', max_bytes: int = 256 * 1024 * 1024):
+        """
+        Args:
+            cache_dir: Directory for the cached .npy files
+            max_bytes (int): Size limit of the cache, least recently used entries are removed first
+        """
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.lock = Lock()
+        self.entries = OrderedDict()  # key -> (path, samplerate, size), least recently used first
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+
+        # Temporary files of writes that were interrupted by a crash
+        for path in self.cache_dir.glob('*.tmp'):
+            try:
+                path.unlink()
+            except OSError:
+                pass
+
+        # Load existing entries, file modification time is the last use
+        files = sorted(self.cache_dir.glob('*.npy'), key=lambda f: f.stat().st_mtime)
+        for path in files:
+            key, _, samplerate = path.stem.rpartition('_')
+            if not key or not samplerate.isdigit():
+                continue
+            size = path.stat().st_size
+            self.entries[key] = (path, int(samplerate), size)
+            self.total_bytes += size
+        self._evict()
+
+    @staticmethod
+    def make_key(text: str, voice: str, model: str, speed: float) -> str:
+        """Key of a phrase, the hash of everything that changes the synthesized audio"""
+        payload = json.dumps([text, voice, model, speed], ensure_ascii=False)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key: str):
+        """Get (samples, samplerate) for a key or None, samples are memory-mapped"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            path, samplerate, size = entry
+            try:
+                data = np.load(path, mmap_mode='r')
+                os.utime(path)
+            except (OSError, ValueError) as e:
+                print(f"Error loading cached speech {path}: {e}")
+                del self.entries[key]
+                self.total_bytes -= size
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            self.bytes_saved += size
+            return data, samplerate
+
+    def put(self, key: str, data, samplerate: int):
+        """Store decoded samples for a key"""
+        path = self.cache_dir / f"{key}_{samplerate}.npy"
+        # Unique temporary file, preload() and the synthesis thread may store the same key at once
+        with tempfile.NamedTemporaryFile(dir=self.cache_dir, suffix='.tmp', delete=False) as f:
+            np.save(f, np.ascontiguousarray(data, dtype=np.float32))
+        # Atomic rename, readers never see a partially written file
+        os.replace(f.name, path)
+        size = path.stat().st_size
+        with self.lock:
+            if key in self.entries:
+                self.total_bytes -= self.entries[key][2]
+            self.entries[key] = (path, samplerate, size)
+            self.entries.move_to_end(key)
+            self.total_bytes += size
+            self._evict()
+
+    def _evict(self):
+        """Remove least recently used entries until the cache fits into max_bytes"""
+        while self.total_bytes > self.max_bytes and len(self.entries) > 1:
+            _, (path, _, size) = self.entries.popitem(last=False)
+            self.total_bytes -= size
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def __contains__(self, key: str) -> bool:
+        with self.lock:
+            return key in self.entries
+
+    def get_stats(self) -> dict:
+        """Get cache hit rate and the amount of audio served from disk"""
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "size_bytes": self.total_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "bytes_saved": self.bytes_saved
+            }
+
+    def print_stats(self):
+        stats = self.get_stats()
+        print(f"TTS cache: {stats['hits']} hits, {stats['misses']} misses "
+              f"(hit rate {stats['hit_rate']:.1%}), {stats['bytes_saved'] / 1024:.1f} KiB saved, "
+              f"{stats['entries']} entries / {stats['size_bytes'] / 1024:.1f} KiB on disk")
+
 
 class OpenAITTSQueue:
-    def __init__(self, client = None):
-        """Initialize the TTS queue system using OpenAI's API"""
+    def __init__(self, client = None, streaming: bool = False, jitter_buffer_ms: int = 200, chunk_size: int = 4096,
+                 sentence_pipelining: bool = True, prefetch_depth: int = 2, cache: Optional[TTSCache] = None,
+                 event_bus: Optional[EventBus] = None):
+        """
+        Initialize the TTS queue system using OpenAI's API
+
+        Args:
+            client: OpenAI client
+            streaming (bool): Request raw PCM and play it while it is being downloaded
+            jitter_buffer_ms (int): Audio to buffer before playback starts in streaming mode
+            chunk_size (int): Size in bytes of the chunks read from the API response
+            sentence_pipelining (bool): Synthesize each sentence separately so playback starts after the first one
+            prefetch_depth (int): How many synthesized sentences may wait for playback
+            cache (TTSCache): Optional cache of synthesized phrases
+            event_bus (EventBus): Bus for speech started/finished signals, shared with the command queue
+        """
         self.queue = Queue()
+        self.audio_queue = Queue(maxsize=max(1, prefetch_depth))
         self.is_running = True
         self.speaking_lock = Lock()
         self.is_speaking = False
-        self.temp_dir = tempfile.mkdtemp()
-        
+        self.event_bus = event_bus or EventBus()
+
+        # Requests that were added and are not yet played or discarded
+        self.pending_lock = Lock()
+        self.pending = 0
+        # Incremented by clear_queue, requests from older generations are dropped
+        self.generation = 0
+        # The same per tag, for clearing the requests of one speaker only
+        self.tag_generations = {}
+        self.tag_pending = {}
+        self.current_clip = None
+
         # Initialize OpenAI client
         self.client = client
-        
-        # Start worker thread
+        self.model = "tts-1"
+        self.cache = cache
+
+        # Streaming playback settings
+        self.streaming = streaming
+        self.jitter_buffer_ms = jitter_buffer_ms
+        self.chunk_size = chunk_size
+        self.sentence_pipelining = sentence_pipelining
+        self.last_time_to_first_audio = None
+        self.last_synthesis_latency = None
+
+        # Start worker threads
         self._initialize_worker()
 
     def _initialize_worker(self):
-        """Initialize the worker thread that processes the queue"""
+        """Initialize the worker threads that synthesize and play the queue"""
         self.worker_thread = threading.Thread(target=self._process_queue)
         self.worker_thread.daemon = True
         self.worker_thread.start()
 
+        self.playback_thread = threading.Thread(target=self._process_playback)
+        self.playback_thread.daemon = True
+        self.playback_thread.start()
+
+    def _is_stale(self, request: TTSRequest) -> bool:
+        if request.generation != self.generation:
+            return True
+        return request.tag is not None and request.tag_generation != self.tag_generations.get(request.tag, 0)
+
+    def _release_pending(self, request: TTSRequest):
+        with self.pending_lock:
+            self.pending -= 1
+            pending = self.pending
+            # Requests of a cleared tag were already taken off its count
+            tagged = request.tag is not None and not self._is_stale(request)
+            if tagged:
+                self.tag_pending[request.tag] -= 1
+        tracer.counter("tts.queue_depth", pending)
+        if tagged:
+            self.event_bus.publish(SPEECH_DONE)
+        if pending <= 0:
+            self.event_bus.publish(TTS_IDLE)
+        return pending
+
     def _process_queue(self):
-        """Process items in the queue"""
+        """Synthesize queued requests ahead of playback"""
         while self.is_running:
-            try:
-                request = self.queue.get(timeout=1.0)
-                self.set_speaking(True)
-                print("Speaking...")
-                self._process_tts_request(request)
+            request = self.queue.get()
+            if request is None:
+                break
+            if self._is_stale(request):
+                self._release_pending(request)
                 self.queue.task_done()
-                self.set_speaking(False)
-                print("Finished speaking.")
-            except QueueEmpty:
                 continue
+
+            clip = SpeechClip(request=request)
+            # Blocks while the prefetch buffer is full, stale clips are dropped by the playback thread
+            self.audio_queue.put(clip)
+            clip.start_ns = time.perf_counter_ns()
+
+            try:
+                with tracer.context(arm=request.tag), span("tts.synthesis", chars=len(request.text)):
+                    self._process_tts_request(clip)
+                if clip.first_chunk_ns:
+                    self.last_synthesis_latency = (clip.first_chunk_ns - clip.start_ns) / 1e9
             except Exception as e:
                 print(f"Error processing TTS request: {str(e)}")
-                self.set_speaking(False)
+            finally:
+                clip.chunks.put(None)
+                self.queue.task_done()
+
+    def _process_tts_request(self, clip: SpeechClip):
+        """Synthesize a single TTS request into its clip"""
+        request = clip.request
+        key = None
+        if self.cache is not None:
+            key = TTSCache.make_key(request.text, request.voice, self.model, request.speed)
+            cached = self.cache.get(key)
+            if cached is not None:
+                data, samplerate = cached
+                self._emit_samples(clip, data, samplerate, request.speed)
+                return
+
+        if self.streaming:
+            data, samplerate = self._process_tts_request_streaming(clip)
+        else:
+            data, samplerate = self._synthesize(request)
+            self._emit_samples(clip, data, samplerate, request.speed)
 
-    def _process_tts_request(self, request: TTSRequest):
-        """Process a single TTS request"""
+        # Only complete synthesis results are cached
+        if key is not None and data is not None:
+            self.cache.put(key, data, samplerate)
+
+    def _emit_samples(self, clip: SpeechClip, data, samplerate: int, speed: float):
+        """Hand decoded samples to playback in blocks"""
+        # Apply speed adjustment by changing the playback sample rate
+        clip.samplerate = int(samplerate * speed)
+        block = int(samplerate * PLAYBACK_BLOCK_SECONDS)
+        for i in range(0, len(data), block):
+            self._put_chunk(clip, data[i:i + block])
+
+    def _put_chunk(self, clip: SpeechClip, samples):
+        if not clip.first_chunk_ns:
+            clip.first_chunk_ns = time.perf_counter_ns()
+        clip.chunks.put(samples)
+
+    def _synthesize(self, request: TTSRequest):
+        """Synthesize a request completely, returns (samples, samplerate)"""
         try:
-            # Create temporary file path for the audio
-            temp_file = Path(self.temp_dir) / f"speech_{threading.get_ident()}.mp3"
-            
             # Generate speech using OpenAI API
+            if self.streaming:
+                response = self.client.audio.speech.create(
+                    model=self.model,
+                    voice=request.voice,
+                    input=request.text,
+                    response_format="pcm"
+                )
+                data = np.frombuffer(response.content, dtype='<i2').astype(np.float32) / 32768.0
+                return data, PCM_SAMPLE_RATE
+
             response = self.client.audio.speech.create(
-                model="tts-1",
+                model=self.model,
                 voice=request.voice,
                 input=request.text
             )
-            
-            # Save to temporary file
-            response.stream_to_file(temp_file)
-            
-            # Read and play the audio
-            data, samplerate = sf.read(temp_file)
-            
-            # Apply speed adjustment if needed
-            if request.speed != 1.0:
-                # Adjust sample rate to change speed
-                adjusted_samplerate = int(samplerate * request.speed)
-                sd.play(data, adjusted_samplerate)
-                sd.wait()
-            else:
-                sd.play(data, samplerate)
-                sd.wait()
-            
-            # Clean up temporary file
-            os.remove(temp_file)
-            
+            # Decode in memory, soundfile is only needed for compressed responses
+            import soundfile as sf
+            return sf.read(io.BytesIO(response.content), dtype='float32')
+
         except Exception as e:
             print(f"Error in TTS processing: {str(e)}")
             print(request)
             raise
 
-    def add_text(self, text: str, speed: float = 1.0, voice: str = 'alloy'):
-        """Add text to the TTS queue"""
-        request = TTSRequest(text=text, speed=speed, voice=voice)
-        self.queue.put(request)
+    def _process_tts_request_streaming(self, clip: SpeechClip):
+        """
+        Synthesize a single TTS request, handing PCM chunks to playback as they arrive.
 
-    def get_queue_size(self) -> int:
-        """Get the current size of the queue"""
-        return self.queue.qsize()
+        Returns (samples, samplerate), samples are None if the request was cancelled.
+        """
+        request = clip.request
+        # Speed is applied the same way as in the file based path: by changing the playback rate
+        clip.samplerate = int(PCM_SAMPLE_RATE * request.speed)
+        pending = b""
+        parts = []
+        try:
+            with self.client.audio.speech.with_streaming_response.create(
+                model=self.model,
+                voice=request.voice,
+                input=request.text,
+                response_format="pcm"
+            ) as response:
+                for chunk in response.iter_bytes(chunk_size=self.chunk_size):
+                    if self._is_stale(request) or not self.is_running:
+                        return None, PCM_SAMPLE_RATE
+                    pending += chunk
+                    # Only whole samples can be converted, keep the odd byte for the next chunk
+                    usable = len(pending) - len(pending) % PCM_SAMPLE_WIDTH
+                    if usable:
+                        samples = np.frombuffer(pending[:usable], dtype='<i2').astype(np.float32) / 32768.0
+                        self._put_chunk(clip, samples)
+                        parts.append(samples)
+                        pending = pending[usable:]
 
-    def clear_queue(self):
-        """Clear all pending items from the queue"""
-        while not self.queue.empty():
+        except Exception as e:
+            print(f"Error in streaming TTS processing: {str(e)}")
+            print(request)
+            raise
+
+        data = np.concatenate(parts) if parts else np.zeros(0, dtype=np.float32)
+        return data, PCM_SAMPLE_RATE
+
+    def _process_playback(self):
+        """Play synthesized clips in the order they were added"""
+        while self.is_running:
+            clip = self.audio_queue.get()
+            if clip is None:
+                break
+
+            if not self._is_stale(clip.request):
+                if not self.is_speaking:
+                    self.set_speaking(True)
+                    print("Speaking...")
+                self.current_clip = clip
+                try:
+                    with tracer.context(arm=clip.request.tag), span("tts.playback", chars=len(clip.request.text)):
+                        self._play_clip(clip)
+                except Exception as e:
+                    print(f"Error playing TTS audio: {str(e)}")
+                self.current_clip = None
+            self.audio_queue.task_done()
+
+            if self._release_pending(clip.request) <= 0 and self.is_speaking:
+                self.set_speaking(False)
+                print("Finished speaking.")
+
+        # Unblock the synthesis thread if it waits for a free prefetch slot
+        while not self.audio_queue.empty():
             try:
-                self.queue.get_nowait()
-                self.queue.task_done()
+                self.audio_queue.get_nowait()
             except QueueEmpty:
                 break
 
+    def _next_chunk(self, clip: SpeechClip):
+        """Get the next chunk of a clip, None at the end of the clip or when it was cancelled"""
+        chunk = clip.chunks.get()
+        if chunk is None or self._is_stale(clip.request) or not self.is_running:
+            return None
+        return chunk
+
+    def _play_clip(self, clip: SpeechClip):
+        """Play a clip through an output stream after filling the jitter buffer"""
+        buffered = []
+        buffered_samples = 0
+        finished = False
+        prebuffer_samples = int(PCM_SAMPLE_RATE * self.jitter_buffer_ms / 1000) if self.streaming else 0
+        while buffered_samples < max(prebuffer_samples, 1):
+            chunk = self._next_chunk(clip)
+            if chunk is None:
+                finished = True
+                break
+            buffered.append(chunk)
+            buffered_samples += len(chunk)
+
+        if not buffered:
+            return
+
+        # Imported here to keep this module light, main.py initializes PortAudio during startup
+        import sounddevice as sd
+        channels = 1 if buffered[0].ndim == 1 else buffered[0].shape[1]
+        stream = sd.OutputStream(samplerate=clip.samplerate, channels=channels, dtype='float32')
+        stream.start()
+        if clip.request.first_sentence:
+            self._record_time_to_first_audio(clip.request)
+        try:
+            for chunk in buffered:
+                stream.write(chunk)
+            while not finished:
+                chunk = self._next_chunk(clip)
+                if chunk is None:
+                    break
+                stream.write(chunk)
+        finally:
+            if self._is_stale(clip.request) or not self.is_running:
+                stream.abort()
+            else:
+                # stop() waits for the buffered audio to finish playing
+                stream.stop()
+            stream.close()
+
+    def _record_time_to_first_audio(self, request: TTSRequest):
+        """Store the time from an add_text() call to the start of playback of its first sentence"""
+        self.last_time_to_first_audio = time.time() - request.submit_time
+        tracer.complete("tts.first_audio", request.submit_ns, time.perf_counter_ns())
+        print(f"Time to first audio: {self.last_time_to_first_audio:.4f} seconds")
+
+    def get_time_to_first_audio(self) -> Optional[float]:
+        """Get the time from the last add_text() call to the start of its playback in seconds"""
+        return self.last_time_to_first_audio
+
+    def get_synthesis_latency(self) -> Optional[float]:
+        """Get the time from the start of synthesis of the last sentence to its first audio in seconds"""
+        return self.last_synthesis_latency
+
+    def add_text(self, text: str, speed: float = 1.0, voice: str = 'alloy', tag: Optional[str] = None):
+        """Add text to the TTS queue, tag marks the speaker for clear_queue() and wait_until_done()"""
+        parts = split_sentences(text) if self.sentence_pipelining else [text]
+        submit_time, submit_ns = time.time(), time.perf_counter_ns()
+        for i, part in enumerate(parts):
+            with self.pending_lock:
+                request = TTSRequest(text=part, speed=speed, voice=voice, generation=self.generation, tag=tag,
+                                     tag_generation=self.tag_generations.get(tag, 0), first_sentence=i == 0,
+                                     submit_time=submit_time, submit_ns=submit_ns)
+                self.pending += 1
+                pending = self.pending
+                if tag is not None:
+                    self.tag_pending[tag] = self.tag_pending.get(tag, 0) + 1
+            tracer.counter("tts.queue_depth", pending)
+            self.queue.put(request)
+
+    def preload(self, phrases, speed: float = 1.0, voice: str = 'alloy') -> int:
+        """
+        Synthesize phrases into the cache without playing them.
+
+        Args:
+            phrases: Texts that are expected to be spoken later with the same speed and voice
+
+        Returns:
+            int: Number of sentences that had to be synthesized
+        """
+        if self.cache is None:
+            raise ValueError("preload requires a TTSCache")
+
+        synthesized = 0
+        for text in phrases:
+            parts = split_sentences(text) if self.sentence_pipelining else [text]
+            for part in parts:
+                key = TTSCache.make_key(part, voice, self.model, speed)
+                if key in self.cache:
+                    continue
+                data, samplerate = self._synthesize(TTSRequest(text=part, speed=speed, voice=voice))
+                self.cache.put(key, data, samplerate)
+                synthesized += 1
+        print(f"Preloaded {synthesized} phrases into the TTS cache")
+        return synthesized
+
+    def get_queue_size(self) -> int:
+        """Get the number of requests waiting to be synthesized or played"""
+        with self.pending_lock:
+            return self.pending
+
+    def clear_queue(self, tag: Optional[str] = None):
+        """
+        Clear all pending items from the queue and cut off the current playback.
+
+        With a tag only the requests of that tag are dropped, the other speakers keep talking.
+        """
+        if tag is not None:
+            self._clear_tag(tag)
+            return
+        with self.pending_lock:
+            self.generation += 1
+            self.tag_pending = dict.fromkeys(self.tag_pending, 0)
+        for queue in (self.queue, self.audio_queue):
+            while not queue.empty():
+                try:
+                    item = queue.get_nowait()
+                    queue.task_done()
+                    if item is not None:
+                        self._release_pending(item.request if isinstance(item, SpeechClip) else item)
+                except QueueEmpty:
+                    break
+        self.event_bus.publish(SPEECH_DONE)
+        # Wake up the playback thread if it waits for more audio of the current clip
+        clip = self.current_clip
+        if clip is not None:
+            clip.chunks.put(None)
+
+    def _clear_tag(self, tag: str):
+        # Queued requests of the tag stay in the queues and are skipped as stale by the worker threads
+        with self.pending_lock:
+            self.tag_generations[tag] = self.tag_generations.get(tag, 0) + 1
+            self.tag_pending[tag] = 0
+        self.event_bus.publish(SPEECH_DONE)
+        clip = self.current_clip
+        if clip is not None and clip.request.tag == tag:
+            clip.chunks.put(None)
+
+    def channel(self, tag: str) -> "TTSChannel":
+        """Queue of one speaker, such as one arm, sharing the voice and the playback of this queue"""
+        return TTSChannel(self, tag)
+
     def stop(self):
         """Stop the TTS system and clean up"""
         self.is_running = False
-        sd.stop()
         self.clear_queue()
-        if self.worker_thread.is_alive():
-            self.worker_thread.join()
-        
-        # Clean up temp directory
-        try:
-            os.rmdir(self.temp_dir)
-        except:
-            pass
+        # Wake up idle worker threads
+        for queue in (self.queue, self.audio_queue):
+            try:
+                queue.put_nowait(None)
+            except QueueFull:
+                pass
+        for thread in (self.worker_thread, self.playback_thread):
+            if thread.is_alive():
+                thread.join(timeout=2.0)
 
     def set_speaking(self, state: bool):
         """Set the speaking state"""
         with self.speaking_lock:
             self.is_speaking = state
+        self.event_bus.publish(SPEECH_STARTED if state else SPEECH_FINISHED)
 
-    def is_busy(self) -> bool:
-        """Check if the TTS system is currently busy (speaking or has items in queue)"""
+    def is_busy(self, tag: Optional[str] = None) -> bool:
+        """Check if the TTS system is currently busy (speaking or has items in queue), only requests of tag if given"""
+        if tag is not None:
+            with self.pending_lock:
+                return self.tag_pending.get(tag, 0) > 0
         with self.speaking_lock:
-            return self.is_speaking or not self.queue.empty()
+            return self.is_speaking or self.get_queue_size() > 0
 
-    def wait_until_done(self, check_interval: float = 0.1):
+    def wait_until_done(self, timeout: Optional[float] = None, tag: Optional[str] = None) -> bool:
         """
         Wait until all speech is finished and the queue is empty.
-        
+
         Args:
-            check_interval (float): How often to check the status in seconds
+            timeout (float): Maximum time to wait in seconds, None waits forever
+            tag (str): Only wait for the requests of this tag
+
+        Returns:
+            bool: True if the queue became idle
         """
-        while self.is_busy():
-            time.sleep(check_interval)
+        return self.event_bus.wait_for(lambda: not self.is_busy(tag), timeout)
+
+
+class TTSChannel:
+    """
+    Requests of one speaker on a shared OpenAITTSQueue.
+
+    Speech of all channels is played in order through the same output, but clear_queue() only cuts off
+    this channel and wait_until_done() only waits for it.
+    """
+
+    def __init__(self, queue: OpenAITTSQueue, tag: str):
+        self.queue = queue
+        self.tag = tag
+
+    def add_text(self, text: str, speed: float = 1.0, voice: str = 'alloy'):
+        self.queue.add_text(text, speed, voice, tag=self.tag)
+
+    def clear_queue(self):
+        self.queue.clear_queue(self.tag)
+
+    def is_busy(self) -> bool:
+        return self.queue.is_busy(self.tag)
+
+    def wait_until_done(self, timeout: Optional[float] = None) -> bool:
+        return self.queue.wait_until_done(timeout, self.tag)
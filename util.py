@@ -2,18 +2,20 @@ import io
 import base64
 import urllib.parse
 from PIL import Image
+from tracing import span
 
 
 def image_to_uri(image):
-    # Convert the numpy array to an Image object
-    image = Image.fromarray(image)
+    with span("image.encode"):
+        # Convert the numpy array to an Image object
+        image = Image.fromarray(image)
 
-    #image = image.resize((512, 512))
-    
-    buffered = io.BytesIO()
-    image.save(buffered, format="PNG")
-    
-    img_str = base64.b64encode(buffered.getvalue()).decode("utf-8")
+        #image = image.resize((512, 512))
+
+        buffered = io.BytesIO()
+        image.save(buffered, format="PNG")
+
+        img_str = base64.b64encode(buffered.getvalue()).decode("utf-8")
     img_uri = f"{img_str}"
     return img_uri
 
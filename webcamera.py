@@ -2,6 +2,7 @@ import cv2
 import time
 from vidgear.gears import CamGear
 from PIL import Image
+from tracing import span
 
 class WebcamCapture:
     def __init__(self, camera_index=1):
@@ -50,7 +51,8 @@ class WebcamCapture:
             self.setup_stream()
             
         start_time = time.time()
-        frame = self.stream.read()
+        with span("camera.capture"):
+            frame = self.stream.read()
         capture_time = time.time() - start_time
         
         if frame is None: